@@ -13,80 +13,34 @@ const Dashboard = () => {
   const [inventoryValue, setInventoryValue] = useState(null);
 
   useEffect(() => {
-    fetchWeeklySales();
-    fetchUserCount();
-    fetchDeliveredOrdersCount();
-    fetchTotalSales();
-    fetchInventoryValue();
+    fetchOverview();
   }, []);
 
-  
-  const fetchWeeklySales = async () => {
+  // All dashboard metrics come from one request
+  const fetchOverview = async () => {
     try {
       setLoading(true);
-      const response = await fetch('http://localhost:5000/admin/dashboard/weekly_sales');
+      const response = await fetch('http://localhost:5000/admin/dashboard/overview');
       if (!response.ok) {
-        throw new Error('Failed to fetch weekly sales data');
-      }
-      const data = await response.json();
-      setSalesData(data.sales_data);
-    } catch (err) {
-      setError(err.message);
-      console.error('Error fetching weekly sales:', err);
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  const fetchUserCount = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/admin/dashboard/user_count');
-      if (!response.ok) {
-        throw new Error('Failed to fetch user count');
+        throw new Error('Failed to fetch dashboard overview');
       }
       const data = await response.json();
+      setSalesData(data.sales_data || []);
       setUserCount(data.user_count);
-    } catch (err) {
-      console.error('Error fetching user count:', err);
-    }
-  };
-
-  const fetchDeliveredOrdersCount = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/admin/dashboard/delivered_orders_count');
-      if (!response.ok) {
-        throw new Error('Failed to fetch delivered orders count');
-      }
-      const data = await response.json();
       setDeliveredOrdersCount(data.delivered_orders_count);
-    } catch (err) {
-      console.error('Error fetching delivered orders count:', err);
-    }
-  };
-
-  const fetchTotalSales = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/admin/dashboard/total_sales');
-      if (!response.ok) {
-        throw new Error('Failed to fetch total sales');
-      }
-      const data = await response.json();
       setTotalSales(data.total_sales);
-    } catch (err) {
-      console.error('Error fetching total sales:', err);
-    }
-  };
-
-  const fetchInventoryValue = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/admin/dashboard/inventory_value');
-      if (!response.ok) {
-        throw new Error('Failed to fetch inventory value');
-      }
-      const data = await response.json();
       setInventoryValue(data.total_inventory_value);
+      if (data.errors) {
+        console.error('Some dashboard metrics failed:', data.errors);
+        if (data.errors.sales_data) {
+          setError('Failed to fetch weekly sales data');
+        }
+      }
     } catch (err) {
-      console.error('Error fetching inventory value:', err);
+      setError(err.message);
+      console.error('Error fetching dashboard overview:', err);
+    } finally {
+      setLoading(false);
     }
   };
 
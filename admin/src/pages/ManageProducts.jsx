@@ -4,6 +4,7 @@ import Modal from '../components/Modal';
 import { useZxing } from 'react-zxing';
 
 const API_URL = 'http://localhost:5000/admin/product';
+const LOW_STOCK_THRESHOLD = 10;
 
 const ManageProducts = () => {
   const [products, setProducts] = useState([]);
@@ -22,25 +23,43 @@ const ManageProducts = () => {
     created_at: ''
   });
   const [error, setError] = useState('');
+  const [lowStockOnly, setLowStockOnly] = useState(false);
+  // Keyset pagination: cursor of the page on screen and of its neighbours
+  const [cursor, setCursor] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [prevCursor, setPrevCursor] = useState(null);
 
   useEffect(() => {
-    fetchProducts();
-  }, []);
+    // Search runs on the server; wait for typing to pause before querying
+    const timer = setTimeout(() => fetchProducts(null), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm, lowStockOnly]);
 
-  const fetchProducts = async () => {
+  // Refetches only the page on screen; unchanged pages come back as 304s
+  const fetchProducts = async (pageCursor = cursor) => {
     try {
-      const res = await fetch(`${API_URL}/get_products`);
+      const params = new URLSearchParams();
+      if (searchTerm) {
+        params.append('q', searchTerm);
+      }
+      if (lowStockOnly) {
+        params.append('low_stock', LOW_STOCK_THRESHOLD);
+      }
+      if (pageCursor) {
+        params.append('cursor', pageCursor);
+      }
+      const res = await fetch(`${API_URL}/get_products?${params.toString()}`);
       const data = await res.json();
       setProducts(data.products || []);
+      setCursor(pageCursor);
+      setNextCursor(data.next_cursor || null);
+      setPrevCursor(data.prev_cursor || null);
     } catch (err) {
       setProducts([]);
     }
   };
 
-  const filteredProducts = products.filter(product =>
-    product.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    product.barcode.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  const filteredProducts = products;
 
   const handleAddProduct = () => {
     setEditingProduct(null);
@@ -181,6 +200,14 @@ const ManageProducts = () => {
           className="w-full pl-10 pr-4 py-3 bg-slate-800 text-white rounded-xl border border-slate-600 focus:border-violet-500 focus:outline-none"
         />
       </div>
+      <label className="flex items-center space-x-2 text-gray-300">
+        <input
+          type="checkbox"
+          checked={lowStockOnly}
+          onChange={(e) => setLowStockOnly(e.target.checked)}
+        />
+        <span>Low stock only (≤ {LOW_STOCK_THRESHOLD})</span>
+      </label>
 
       {/* Products List View */}
       <div className="overflow-x-auto rounded-xl bg-slate-800">
@@ -229,6 +256,22 @@ const ManageProducts = () => {
             ))}
           </tbody>
         </table>
+        <div className="px-6 py-4 border-t border-slate-700 flex items-center justify-between">
+          <button
+            onClick={() => fetchProducts(prevCursor)}
+            disabled={!prevCursor}
+            className="px-4 py-2 rounded-lg bg-slate-700 text-white disabled:opacity-50"
+          >
+            Previous
+          </button>
+          <button
+            onClick={() => fetchProducts(nextCursor)}
+            disabled={!nextCursor}
+            className="px-4 py-2 rounded-lg bg-slate-700 text-white disabled:opacity-50"
+          >
+            Next
+          </button>
+        </div>
       </div>
 
       {/* Add/Edit Product Modal */}
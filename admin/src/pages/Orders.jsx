@@ -13,12 +13,19 @@ const Orders = () => {
   const [selectedOrder, setSelectedOrder] = useState(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [loading, setLoading] = useState(false);
+  // Keyset pagination: cursor of the page on screen and of its neighbours
+  const [cursor, setCursor] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [prevCursor, setPrevCursor] = useState(null);
+  const [page, setPage] = useState(1);
 
   useEffect(() => {
-    fetchOrders();
+    // A filter change starts again from the first page
+    setPage(1);
+    fetchOrders(null);
   }, [paymentStatusFilter, amountFilter, amountValue]);
 
-  const fetchOrders = async () => {
+  const fetchOrders = async (pageCursor = cursor) => {
     try {
       // Build query parameters
       const params = new URLSearchParams();
@@ -29,18 +36,29 @@ const Orders = () => {
         params.append('amount_filter', amountFilter);
         params.append('amount_value', amountValue);
       }
+      if (pageCursor) {
+        params.append('cursor', pageCursor);
+      }
 
       const url = `${API_URL}/get_orders${params.toString() ? '?' + params.toString() : ''}`;
       const res = await fetch(url);
       const data = await res.json();
-      // Display newest orders first: reverse the received list
+      // The backend returns newest orders first
       const list = data.orders || [];
-      setOrders(Array.isArray(list) ? list.slice().reverse() : []);
+      setOrders(Array.isArray(list) ? list : []);
+      setCursor(pageCursor);
+      setNextCursor(data.next_cursor || null);
+      setPrevCursor(data.prev_cursor || null);
     } catch (err) {
       setOrders([]);
     }
   };
 
+  const goToPage = async (pageCursor, delta) => {
+    await fetchOrders(pageCursor);
+    setPage((current) => current + delta);
+  };
+
   const getPaymentStatusColor = (status) => {
     switch (status) {
       case 'Completed': return 'bg-emerald-500 text-white';
@@ -233,6 +251,23 @@ const Orders = () => {
             </tbody>
           </table>
         </div>
+        <div className="px-6 py-4 border-t border-slate-600 flex items-center justify-between">
+          <button
+            onClick={() => goToPage(prevCursor, -1)}
+            disabled={!prevCursor}
+            className="px-4 py-2 rounded-lg bg-slate-700 text-white disabled:opacity-50"
+          >
+            Previous
+          </button>
+          <span className="text-gray-400">Page {page}</span>
+          <button
+            onClick={() => goToPage(nextCursor, 1)}
+            disabled={!nextCursor}
+            className="px-4 py-2 rounded-lg bg-slate-700 text-white disabled:opacity-50"
+          >
+            Next
+          </button>
+        </div>
       </div>
 
       {/* Order Details Modal */}
@@ -6,6 +6,11 @@ const Payments = () => {
   const [filterStatus, setFilterStatus] = useState('All');
   const [filterDate, setFilterDate] = useState('All');
   const [transactions, setTransactions] = useState([]);
+  // Keyset pagination: the backend returns opaque cursors for the adjacent pages
+  const [page, setPage] = useState(1);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [prevCursor, setPrevCursor] = useState(null);
+  const [totalPages, setTotalPages] = useState(1);
   const [monthlyRevenue, setMonthlyRevenue] = useState([]);
   const [weeklyRevenue, setWeeklyRevenue] = useState([]);
   const [summary, setSummary] = useState({
@@ -38,28 +43,57 @@ const Payments = () => {
   };
 
   useEffect(() => {
+    // A filter change starts again from the first page
+    setPage(1);
     fetchPaymentsData();
   }, [filterStatus, filterDate]);
 
+  const fetchTransactions = async (pageCursor) => {
+    const cursorParam = pageCursor ? `&cursor=${encodeURIComponent(pageCursor)}` : '';
+    const response = await fetch(`http://localhost:5000/admin/payments/transactions?status=${filterStatus}&date=${filterDate}${cursorParam}`);
+    if (!response.ok) {
+      throw new Error('Failed to fetch transactions');
+    }
+    const data = await response.json();
+    setTransactions(data.transactions || []);
+    setNextCursor(data.next_cursor || null);
+    setPrevCursor(data.prev_cursor || null);
+    setTotalPages(data.total_pages || 1);
+    return data;
+  };
+
+  const goToPage = async (pageCursor, delta) => {
+    try {
+      setLoading(true);
+      setError(null);
+      await fetchTransactions(pageCursor);
+      setPage((current) => current + delta);
+    } catch (err) {
+      setError(err.message);
+      console.error('Error fetching transactions:', err);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const fetchPaymentsData = async () => {
     try {
       setLoading(true);
       setError(null);
 
       // Fetch all data in parallel
-      const [transactionsRes, monthlyRes, weeklyRes, summaryRes] = await Promise.all([
-        fetch(`http://localhost:5000/admin/payments/transactions?status=${filterStatus}&date=${filterDate}`),
+      const [transactionsData, monthlyRes, weeklyRes, summaryRes] = await Promise.all([
+        fetchTransactions(null),
         fetch(`http://localhost:5000/admin/payments/monthly_revenue?status=${filterStatus}&date=${filterDate}`),
         fetch(`http://localhost:5000/admin/payments/weekly_revenue?status=${filterStatus}&date=${filterDate}`),
         fetch(`http://localhost:5000/admin/payments/summary?status=${filterStatus}&date=${filterDate}`)
       ]);
 
-      if (!transactionsRes.ok || !monthlyRes.ok || !weeklyRes.ok || !summaryRes.ok) {
+      if (!monthlyRes.ok || !weeklyRes.ok || !summaryRes.ok) {
         throw new Error('Failed to fetch payments data');
       }
 
-      const [transactionsData, monthlyData, weeklyData, summaryData] = await Promise.all([
-        transactionsRes.json(),
+      const [monthlyData, weeklyData, summaryData] = await Promise.all([
         monthlyRes.json(),
         weeklyRes.json(),
         summaryRes.json()
@@ -72,7 +106,6 @@ const Payments = () => {
         summary: summaryData
       });
 
-      setTransactions(transactionsData.transactions || []);
       setMonthlyRevenue(monthlyData.monthly_revenue || []);
       setWeeklyRevenue(weeklyData.weekly_revenue || []);
       setSummary(summaryData);
@@ -144,8 +177,8 @@ const Payments = () => {
             className="px-3 py-2 bg-slate-800 text-white rounded-lg border border-slate-600 focus:border-violet-500 focus:outline-none"
           >
             <option value="All">All Dates</option>
-            <option value="2024-01-15">Today</option>
-            <option value="2024-01">This Month</option>
+            <option value="Today">Today</option>
+            <option value="This Month">This Month</option>
           </select>
         </div>
       </div>
@@ -328,6 +361,23 @@ const Payments = () => {
             </tbody>
           </table>
         </div>
+        <div className="px-6 py-4 border-t border-slate-600 flex items-center justify-between">
+          <button
+            onClick={() => goToPage(prevCursor, -1)}
+            disabled={!prevCursor || loading}
+            className="px-4 py-2 rounded-lg bg-slate-700 text-white disabled:opacity-50"
+          >
+            Previous
+          </button>
+          <span className="text-gray-400">Page {page} of ~{Math.max(totalPages, page)}</span>
+          <button
+            onClick={() => goToPage(nextCursor, 1)}
+            disabled={!nextCursor || loading}
+            className="px-4 py-2 rounded-lg bg-slate-700 text-white disabled:opacity-50"
+          >
+            Next
+          </button>
+        </div>
       </div>
     </div>
   );
@@ -1,7 +1,20 @@
 from flask import Blueprint, request, jsonify
-from db import get_db
+from werkzeug.http import generate_etag
+from db import get_db, get_executor
+from cache import (cache_stats, count_cache, get_user_names, invalidate_discount_view,
+                   invalidate_discounts, invalidate_product)
+from pagination import keyset_page
+from versions import CATALOG, DISCOUNTS, bump_version, get_version
+from conditional import conditional
+from rollups import sales_by
+from filters import ROLLUP_INDEX, STATUS_VALUES, compile_payment_filter, compile_rollup_filter
+from payments import COMPLETED
 from werkzeug.security import check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
+import os
+import re
+import time
 from bson import ObjectId
 
 admin_bp = Blueprint('admin', __name__)
@@ -57,6 +70,10 @@ def add_product():
         'is_active': bool(data['is_active']),
         'created_at': data['created_at']
     })
+    # Drop cached "not found" results for the new identifiers
+    invalidate_product(product_id, data['barcode'])
+    invalidate_discount_view()
+    bump_version(db, CATALOG)
     return jsonify({'message': 'Product added successfully'}), 201
 
 @admin_bp.route('/admin/product/delete_product', methods=['DELETE'])
@@ -111,9 +128,13 @@ def delete_product():
     last_error = None
     for f in delete_filters:
         try:
-            res = db.products.delete_one(f)
-            if res.deleted_count:
-                deleted += res.deleted_count
+            # find_one_and_delete returns the document so its cache entries can be dropped
+            removed = db.products.find_one_and_delete(f, projection={'product_id': 1, 'barcode': 1})
+            if removed:
+                deleted += 1
+                invalidate_product(removed.get('product_id'), removed.get('barcode'))
+                invalidate_discount_view()
+                bump_version(db, CATALOG)
                 break
         except Exception as e:
             last_error = str(e)
@@ -135,15 +156,82 @@ def update_product():
     result = db.products.update_one({'product_id': data['product_id']}, {'$set': update_fields})
     if result.matched_count == 0:
         return jsonify({'message': 'Product not found'}), 404
+    invalidate_product(data['product_id'], update_fields.get('barcode'))
+    if update_fields.keys() & {'name', 'barcode', 'price', 'discount_id'}:
+        invalidate_discount_view()
+    bump_version(db, CATALOG)
     return jsonify({'message': 'Product updated successfully'}), 200
 
+# Stock moves with every cart change without bumping the catalog version;
+# listing validators also roll over after this many seconds so stock shown
+# in the admin is at most this stale.
+CATALOG_STOCK_WINDOW = int(os.getenv('CATALOG_STOCK_WINDOW', 30))
+
+PRODUCT_LIST_FIELDS = {
+    'product_id': 1, 'name': 1, 'barcode': 1, 'description': 1, 'price': 1,
+    'discount_id': 1, 'stck_qty': 1, 'is_active': 1, 'created_at': 1
+}
+PRODUCTS_SORT = [('name', 1), ('_id', 1)]
+MAX_PAGE_LIMIT = 200
+
+def page_limit(value, default=50):
+    """Page size from the limit query parameter, clamped to 1..MAX_PAGE_LIMIT.
+    Raises ValueError when it is not an integer."""
+    if value is None:
+        return default
+    try:
+        return max(1, min(int(value), MAX_PAGE_LIMIT))
+    except ValueError:
+        raise ValueError('Invalid limit')
+
+def _catalog_etag():
+    # The ETag is per URL, so it need not include the page or filters
+    return f'catalog-{get_version(get_db(), CATALOG)}-{int(time.time() // CATALOG_STOCK_WINDOW)}'
+
 @admin_bp.route('/admin/product/get_products', methods=['GET'])
+@conditional(_catalog_etag)
 def get_products():
     db = get_db()
-    products = list(db.products.find({}, {'image_url': 0}))  # Exclude image_url
-    for product in products:
-        product['_id'] = str(product['_id'])  # Convert ObjectId to string for JSON
-    return jsonify({'products': products}), 200
+    query = {}
+    search = (request.args.get('q') or '').strip()
+    if search:
+        # Name anywhere (case-insensitive) or barcode prefix
+        query['$or'] = [
+            {'name': {'$regex': re.escape(search), '$options': 'i'}},
+            {'barcode': {'$regex': '^' + re.escape(search)}}
+        ]
+    active = request.args.get('active')
+    if active in ('true', 'false'):
+        query['is_active'] = active == 'true'
+    low_stock = request.args.get('low_stock')
+    if low_stock:
+        try:
+            query['stck_qty'] = {'$lte': int(low_stock)}
+        except ValueError:
+            return jsonify({'message': 'low_stock must be an integer'}), 400
+
+    try:
+        limit = page_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    try:
+        products, next_cursor, prev_cursor = keyset_page(
+            db.products, query, PRODUCTS_SORT, limit,
+            cursor=request.args.get('cursor'), projection=PRODUCT_LIST_FIELDS
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return jsonify({
+        'products': products,
+        'total_count': count_cache.get(db.products, query),
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    }), 200
+
+# Newest first; backed by the order_date + _id indexes on orders
+ORDERS_SORT = [('order_date', -1), ('_id', -1)]
 
 @admin_bp.route('/admin/order/get_orders', methods=['GET'])
 def get_orders():
@@ -174,61 +262,51 @@ def get_orders():
                 match_conditions['total_amount'] = {'$lt': amount_val}
         except ValueError:
             pass
-    
-    pipeline = [
-        {
-            '$lookup': {
-                'from': 'users',
-                'localField': 'user_id',
-                'foreignField': 'user_id',
-                'as': 'user_info'
-            }
-        },
-        {
-            '$unwind': {
-                'path': '$user_info',
-                'preserveNullAndEmptyArrays': True
-            }
-        }
-    ]
-    
-    # Add match stage if filters are applied
-    if match_conditions:
-        pipeline.append({'$match': match_conditions})
-    
-    pipeline.append({
-        '$project': {
-            '_id': 1,  # Keep _id for ObjectId
-            'customer': '$user_info.name',
-            'payment_status': {
-                '$cond': [
-                    {'$eq': ['$payment_status', 'Completed']},
-                    'Completed',
-                    {'$cond': [{'$eq': ['$payment_status', 'failed']}, 'Failed', 'Unpaid']}
-                ]
-            },
-            'delivery_status': 1,
-            'date': {
-                '$cond': [
-                    {'$ne': ['$order_date', None]},
-                    {'$dateToString': {'format': '%Y-%m-%d %H:%M:%S', 'date': '$order_date'}},
-                    {'$ifNull': ['$created_at', '']}
-                ]
-            },
-            'total': '$total_amount'
-        }
-    })
-    
-    # Add sorting by date (newest first)
-    pipeline.append({'$sort': {'order_date': -1}})
-    
-    orders = list(db.orders.aggregate(pipeline))
-    # Convert _id to string and assign to order_id
+
+    # Filter and sort on the orders themselves, one keyset page at a time
+    try:
+        limit = page_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    try:
+        orders, next_cursor, prev_cursor = keyset_page(
+            db.orders, match_conditions, ORDERS_SORT, limit,
+            cursor=request.args.get('cursor'),
+            projection={'user_id': 1, 'payment_status': 1, 'delivery_status': 1,
+                        'order_date': 1, 'created_at': 1, 'total_amount': 1}
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    # Customer names only for the returned page, with at most one $in query
+    customer_names = get_user_names(db, [o['user_id'] for o in orders if o.get('user_id')])
+
+    page = []
     for order in orders:
-        order['order_id'] = str(order['_id'])
-        del order['_id']
-    
-    return jsonify({'orders': orders}), 200
+        payment_status = order.get('payment_status')
+        if payment_status != 'Completed':
+            payment_status = 'Failed' if payment_status == 'failed' else 'Unpaid'
+        row = {
+            'order_id': str(order['_id']),
+            'payment_status': payment_status,
+            'delivery_status': order.get('delivery_status'),
+            # Dates are formatted by the app's JSON provider
+            'date': order.get('order_date') or order.get('created_at') or '',
+            'total': order.get('total_amount')
+        }
+        # Like the former $lookup projection, no key when no user name matches
+        customer = customer_names.get(order.get('user_id'))
+        if customer is not None:
+            row['customer'] = customer
+        page.append(row)
+
+    return jsonify({
+        'orders': page,
+        'total_count': count_cache.get(db.orders, match_conditions),
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    }), 200
 
 @admin_bp.route('/admin/order/get_order_details', methods=['POST'])
 def get_order_details():
@@ -248,17 +326,7 @@ def get_order_details():
         if not order:
             return jsonify({'message': 'Order not found'}), 404
         
-        # Convert ObjectId to string for JSON serialization
-        order['_id'] = str(order['_id'])
-        
-        # Format dates for frontend
-        if 'order_date' in order and isinstance(order['order_date'], datetime):
-            order['order_date'] = order['order_date'].strftime('%Y-%m-%d %H:%M:%S')
-        if 'created_at' in order and isinstance(order['created_at'], datetime):
-            order['created_at'] = order['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-        if 'updated_at' in order and isinstance(order['updated_at'], datetime):
-            order['updated_at'] = order['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
-        
+        # ObjectId and dates are encoded by the app's JSON provider
         return jsonify({'order': order}), 200
         
     except Exception as e:
@@ -280,124 +348,181 @@ def mark_order_delivered():
         return jsonify({'message': 'Order not found'}), 404
     return jsonify({'message': 'Order marked as delivered'}), 200
 
-@admin_bp.route('/admin/dashboard/weekly_sales', methods=['GET'])
-def get_weekly_sales():
-    db = get_db()
-    try:
-        # Compute last 7 days range [start_of_day 6 days ago, start_of_tomorrow)
-        today = datetime.now().date()
-        from datetime import timedelta
-        start_date = today - timedelta(days=6)
-        start_dt = datetime(start_date.year, start_date.month, start_date.day)
-        end_dt = datetime(today.year, today.month, today.day) + timedelta(days=1)
-
-        # Aggregate payments collection by created_at (which may be datetime)
-        pipeline = [
-            {
-                '$addFields': {
-                    'paymentDate': {
-                        '$cond': [
-                            {'$eq': [{'$type': '$created_at'}, 'date']},
-                            '$created_at',
-                            {'$toDate': '$created_at'}
-                        ]
-                    }
-                }
-            },
-            {
-                '$match': {
-                    'paymentDate': {'$gte': start_dt, '$lt': end_dt}
-                }
-            },
-            {
-                '$group': {
-                    '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$paymentDate'}},
-                    'sales': {'$sum': '$amount'}
-                }
-            }
-        ]
+def weekly_sales_match(today):
+    # Last 7 days range [start_of_day 6 days ago, start_of_tomorrow)
+    start_date = today - timedelta(days=6)
+    start_dt = datetime(start_date.year, start_date.month, start_date.day)
+    end_dt = datetime(today.year, today.month, today.day) + timedelta(days=1)
+    return {'day': {'$gte': start_dt, '$lt': end_dt}}
 
-        results = list(db.payments.aggregate(pipeline))
-        sales_by_date = {r['_id']: r['sales'] for r in results}
 
-        # Prepare 7-day series chronologically
-        sales_data = []
-        for offset in range(6, -1, -1):
-            d = today - timedelta(days=offset)
-            key = f"{d.year:04d}-{d.month:02d}-{d.day:02d}"
-            # Convert paise to rupees if amounts stored in paise (common case)
-            total_paise = sales_by_date.get(key, 0)
-            try:
-                total_rupees = float(total_paise) if total_paise is not None else 0.0
-            except Exception:
-                # If already in rupees, just cast
-                total_rupees = float(total_paise or 0)
+def _weekly_sales(db):
+    today = datetime.now().date()
+    # At most one rollup row per day, status and payment method
+    return weekly_sales_series(sales_by(db, weekly_sales_match(today), '$day'), today)
+
+
+def weekly_sales_series(results, today):
+    sales_by_date = {r['_id'].date(): r['amount'] for r in results}
+
+    # Prepare 7-day series chronologically
+    sales_data = []
+    for offset in range(6, -1, -1):
+        d = today - timedelta(days=offset)
+        total_rupees = float(sales_by_date.get(d) or 0)
+        name = ['Mon', 'Tues', 'Wed', 'Thurs', 'Fri', 'Sat', 'Sun'][d.weekday()]
+        sales_data.append({'name': name, 'sales': round(total_rupees, 2)})
+    return sales_data
+
+
+USER_COUNT_FILTER = {'role': 'users'}
+DELIVERED_ORDERS_FILTER = {'delivery_status': 'Not Delivered'}
+TOTAL_SALES_PIPELINE = [
+    {'$group': {'_id': None, 'total': {'$sum': '$total_amount'}}}
+]
+INVENTORY_VALUE_PIPELINE = [
+    {'$project': {'value': {'$multiply': ['$price', '$stck_qty']}}},
+    {'$group': {'_id': None, 'total_inventory_value': {'$sum': '$value'}}}
+]
+
+
+def _user_count(db):
+    return db.users.count_documents(USER_COUNT_FILTER)
+
+
+def _delivered_orders_count(db):
+    return db.orders.count_documents(DELIVERED_ORDERS_FILTER)
+
+
+def _total_sales(db):
+    result = list(db.orders.aggregate(TOTAL_SALES_PIPELINE))
+    return result[0]['total'] if result else 0
+
+
+def _inventory_value(db):
+    result = list(db.products.aggregate(INVENTORY_VALUE_PIPELINE))
+    return result[0]['total_inventory_value'] if result else 0
+
 
-            name = ['Mon', 'Tues', 'Wed', 'Thurs', 'Fri', 'Sat', 'Sun'][d.weekday()]
-            sales_data.append({'name': name, 'sales': round(total_rupees, 2)})
+# Response key -> metric. The metrics hit different collections and are
+# independent, so the overview runs them concurrently.
+DASHBOARD_METRICS = {
+    'sales_data': _weekly_sales,
+    'user_count': _user_count,
+    'delivered_orders_count': _delivered_orders_count,
+    'total_sales': _total_sales,
+    'total_inventory_value': _inventory_value,
+}
 
-        return jsonify({'sales_data': sales_data}), 200
+def _timed(metric, db):
+    started = time.perf_counter()
+    value = metric(db)
+    return value, round((time.perf_counter() - started) * 1000, 2)
+
+
+def dashboard_overview(results, started):
+    """Build the overview payload and its ETag from metric key -> (value, ms)
+    or the exception the metric raised."""
+    overview = {}
+    timings = {}
+    errors = {}
+    for key, result in results.items():
+        if isinstance(result, Exception):
+            overview[key] = None
+            errors[key] = str(result)
+        else:
+            overview[key], timings[key] = result
+    timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+
+    # Timings differ on every call, so the ETag only covers the metrics
+    etag = generate_etag(json.dumps(overview, sort_keys=True, default=str).encode('utf-8'))
+    overview['timings_ms'] = timings
+    if errors:
+        # Partial results are still useful to the dashboard
+        overview['errors'] = errors
+    return overview, etag
+
+
+# The metrics move with every order and signup and no version tracks them,
+# so these views have no validator: the ETag is a hash of the computed body,
+# which spares the transfer but not the queries.
+@admin_bp.route('/admin/dashboard/overview', methods=['GET'])
+@conditional()
+def get_dashboard_overview():
+    db = get_db()
+    started = time.perf_counter()
+    pool = get_executor('dashboard', len(DASHBOARD_METRICS))
+    futures = {key: pool.submit(_timed, metric, db) for key, metric in DASHBOARD_METRICS.items()}
+
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            results[key] = e
+    overview, etag = dashboard_overview(results, started)
+    response = jsonify(overview)
+    response.set_etag(etag, weak=True)
+    return response, 200
+
+
+@admin_bp.route('/admin/dashboard/weekly_sales', methods=['GET'])
+@conditional()
+def get_weekly_sales():
+    try:
+        return jsonify({'sales_data': _weekly_sales(get_db())}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching weekly sales: {str(e)}'}), 500
 
 @admin_bp.route('/admin/dashboard/user_count', methods=['GET'])
+@conditional()
 def get_user_count():
-    db = get_db()
     try:
-        count = db.users.count_documents({'role': 'users'})
-        return jsonify({'user_count': count}), 200
+        return jsonify({'user_count': _user_count(get_db())}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching user count: {str(e)}'}), 500
 
 @admin_bp.route('/admin/dashboard/delivered_orders_count', methods=['GET'])
+@conditional()
 def get_delivered_orders_count():
-    db = get_db()
     try:
-        count = db.orders.count_documents({'delivery_status': 'Not Delivered'})
-        return jsonify({'delivered_orders_count': count}), 200
+        return jsonify({'delivered_orders_count': _delivered_orders_count(get_db())}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching delivered orders count: {str(e)}'}), 500
 
 @admin_bp.route('/admin/dashboard/total_sales', methods=['GET'])
+@conditional()
 def get_total_sales():
-    db = get_db()
     try:
-        pipeline = [
-            {'$group': {'_id': None, 'total': {'$sum': '$total_amount'}}}
-        ]
-        result = list(db.orders.aggregate(pipeline))
-        total_sales = result[0]['total'] if result else 0
-        return jsonify({'total_sales': total_sales}), 200
+        return jsonify({'total_sales': _total_sales(get_db())}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching total sales: {str(e)}'}), 500
 
 @admin_bp.route('/admin/dashboard/inventory_value', methods=['GET'])
+@conditional()
 def get_inventory_value():
-    db = get_db()
     try:
-        pipeline = [
-            {'$project': {'value': {'$multiply': ['$price', '$stck_qty']}}},
-            {'$group': {'_id': None, 'total_inventory_value': {'$sum': '$value'}}}
-        ]
-        result = list(db.products.aggregate(pipeline))
-        total_inventory_value = result[0]['total_inventory_value'] if result else 0
-        return jsonify({'total_inventory_value': total_inventory_value}), 200
+        return jsonify({'total_inventory_value': _inventory_value(get_db())}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching inventory value: {str(e)}'}), 500
 
 # Discount Management APIs
+def _discounts_etag():
+    return f'discounts-{get_version(get_db(), DISCOUNTS)}'
+
 @admin_bp.route('/admin/discounts/get_discounts', methods=['GET'])
+@conditional(_discounts_etag)
 def get_discounts():
     db = get_db()
     try:
-        discounts = list(db.discounts.find({}))
-        for discount in discounts:
-            discount['_id'] = str(discount['_id'])
-            # Convert dates to string for JSON serialization
-            if 'start_date' in discount:
-                discount['start_date'] = discount['start_date'].strftime('%Y-%m-%d')
-            if 'end_date' in discount:
-                discount['end_date'] = discount['end_date'].strftime('%Y-%m-%d')
+        # Discount dates are shown date-only, so Mongo formats them; _id is
+        # encoded by the app's JSON provider
+        discounts = list(db.discounts.aggregate([
+            {'$set': {
+                'start_date': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$start_date'}},
+                'end_date': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$end_date'}}
+            }}
+        ]))
         return jsonify({'discounts': discounts}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching discounts: {str(e)}'}), 500
@@ -434,12 +559,17 @@ def add_discount():
     }
     
     result = db.discounts.insert_one(discount_data)
+    invalidate_discounts()
+    bump_version(db, DISCOUNTS)
     
     # Update product with discount_id
     db.products.update_one(
         {'barcode': data['product_barcode']},
         {'$set': {'discount_id': str(result.inserted_id)}}
     )
+    invalidate_product(data['product_barcode'])
+    # discount_id is part of the catalog listing
+    bump_version(db, CATALOG)
     
     return jsonify({'message': 'Discount added successfully', 'discount_id': str(result.inserted_id)}), 201
 
@@ -479,6 +609,8 @@ def update_discount():
     
     if result.matched_count == 0:
         return jsonify({'message': 'Discount not found'}), 404
+    invalidate_discounts()
+    bump_version(db, DISCOUNTS)
     
     return jsonify({'message': 'Discount updated successfully'}), 200
 
@@ -506,12 +638,17 @@ def delete_discount():
             {'barcode': discount['product_barcode']},
             {'$unset': {'discount_id': ''}}
         )
+        invalidate_product(discount['product_barcode'])
+        # discount_id is part of the catalog listing
+        bump_version(db, CATALOG)
     
     # Delete discount
     result = db.discounts.delete_one({'_id': discount_id})
     
     if result.deleted_count == 0:
         return jsonify({'message': 'Discount not found'}), 404
+    invalidate_discounts()
+    bump_version(db, DISCOUNTS)
     
     return jsonify({'message': 'Discount deleted successfully'}), 200
 
@@ -543,235 +680,155 @@ def toggle_discount_status():
     
     if result.matched_count == 0:
         return jsonify({'message': 'Discount not found'}), 404
+    invalidate_discounts()
+    bump_version(db, DISCOUNTS)
     
     return jsonify({'message': f'Discount status changed to {new_status}'}), 200
 
+@admin_bp.route('/admin/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters of this worker's in-process caches"""
+    return jsonify(cache_stats()), 200
+
 # Payments API Endpoints
+# Newest first; _id breaks ties between payments created in the same instant
+TRANSACTIONS_SORT = [('created_at', -1), ('_id', -1)]
+
+def transaction_row(p, customer_names):
+    """Shape a payments row as the transaction object expected by frontend"""
+    t = {}
+    t['_id'] = str(p.get('_id'))
+    t['transaction_id'] = p.get('transaction_id') or p.get('txn_id') or ''
+    t['order_id'] = p.get('order_id')
+
+    customer_name = customer_names.get(p.get('user_id'))
+    t['customer_name'] = customer_name or p.get('customer_name') or ''
+
+    # Amount: already in rupees
+    amt = p.get('amount', 0)
+    try:
+        # Amount is already in rupees, just format it
+        t['amount'] = round(float(amt), 2)
+    except Exception:
+        t['amount'] = amt
+
+    # payment_method in collection -> map to payment_mode expected by frontend
+    pm = p.get('payment_method') or p.get('payment_mode') or ''
+    if isinstance(pm, str):
+        t['payment_mode'] = pm.title()  # 'card' -> 'Card'
+    else:
+        t['payment_mode'] = pm
+
+    t['payment_status'] = p.get('payment_status')
+
+    # transaction date from created_at
+    created_at = p.get('created_at')
+    if isinstance(created_at, datetime):
+        t['transaction_date'] = created_at.strftime('%Y-%m-%d')
+    else:
+        # Legacy string timestamp left unconverted by the migration
+        t['transaction_date'] = str(created_at or '')[:10]
+    return t
+
+def transactions_page(transactions, total_count, limit, next_cursor, prev_cursor):
+    return {
+        'transactions': transactions,
+        'total_count': total_count,
+        'limit': limit,
+        'total_pages': (total_count + limit - 1) // limit,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    }
+
 @admin_bp.route('/admin/payments/transactions', methods=['GET'])
 def get_transactions():
     db = get_db()
     try:
-        # Get query parameters for filtering
-        status_filter = request.args.get('status', 'All')
-        date_filter = request.args.get('date', 'All')
-        
-        # Build filter query
-        filter_query = {}
-        
-        if status_filter != 'All':
-            filter_query['payment_status'] = status_filter
-        
-        # date_filter may be 'All', a full day like '2025-10-16', or a month like '2025-10'
-        if date_filter != 'All':
-            # If user passed an exact day (YYYY-MM-DD)
-            if isinstance(date_filter, str) and len(date_filter) == 10 and date_filter[4] == '-':
-                filter_query['created_at'] = {'$regex': date_filter}
-            # If user passed a month (YYYY-MM)
-            elif isinstance(date_filter, str) and len(date_filter) == 7 and date_filter[4] == '-':
-                filter_query['created_at'] = {'$regex': date_filter}
-            else:
-                # legacy handling: accept tokens like 'Today' or 'This Month'
-                if date_filter == 'Today':
-                    today = datetime.now().strftime('%Y-%m-%d')
-                    filter_query['created_at'] = {'$regex': today}
-                elif date_filter == 'This Month':
-                    current_month = datetime.now().strftime('%Y-%m')
-                    filter_query['created_at'] = {'$regex': current_month}
-        
-        # Get transactions (payments) with pagination
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
-        skip = (page - 1) * limit
-
-        payments_cursor = db.payments.find(filter_query).sort('created_at', -1).skip(skip).limit(limit)
-        payments = list(payments_cursor)
-
-        transactions = []
-        for p in payments:
-            # Build the transaction object expected by frontend
-            t = {}
-            t['_id'] = str(p.get('_id'))
-            t['transaction_id'] = p.get('transaction_id') or p.get('txn_id') or ''
-            t['order_id'] = p.get('order_id')
-
-            # Resolve customer name from users collection if possible
-            user_id = p.get('user_id')
-            customer_name = None
-            if user_id:
-                user = db.users.find_one({'user_id': user_id}, {'name': 1})
-                if user:
-                    customer_name = user.get('name')
-            t['customer_name'] = customer_name or p.get('customer_name') or ''
-
-            # Amount: already in rupees
-            amt = p.get('amount', 0)
-            try:
-                # Amount is already in rupees, just format it
-                t['amount'] = round(float(amt), 2)
-            except Exception:
-                t['amount'] = amt
-
-            # payment_method in collection -> map to payment_mode expected by frontend
-            pm = p.get('payment_method') or p.get('payment_mode') or ''
-            if isinstance(pm, str):
-                t['payment_mode'] = pm.title()  # 'card' -> 'Card'
-            else:
-                t['payment_mode'] = pm
-
-            t['payment_status'] = p.get('payment_status')
-
-            # transaction date from created_at
-            created_at = p.get('created_at')
-            if created_at and hasattr(created_at, 'strftime'):
-                t['transaction_date'] = created_at.strftime('%Y-%m-%d')
-            else:
-                t['transaction_date'] = str(created_at or '')
-
-            transactions.append(t)
-
-        # Get total count for pagination (based on filter applied to payments)
-        total_count = db.payments.count_documents(filter_query)
-
-        return jsonify({
-            'transactions': transactions,
-            'total_count': total_count,
-            'page': page,
-            'limit': limit,
-            'total_pages': (total_count + limit - 1) // limit
-        }), 200
+        # Get transactions (payments) one keyset page at a time
+        try:
+            limit = page_limit(request.args.get('limit'))
+            filter_query, hint = compile_payment_filter(request.args.get('status', 'All'),
+                                                        request.args.get('date', 'All'))
+            payments, next_cursor, prev_cursor = keyset_page(
+                db.payments, filter_query, TRANSACTIONS_SORT, limit,
+                cursor=request.args.get('cursor'), hint=hint
+            )
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        # Resolve every customer name on the page with at most one $in query
+        customer_names = get_user_names(db, [p['user_id'] for p in payments if p.get('user_id')])
+
+        transactions = [transaction_row(p, customer_names) for p in payments]
+
+        # Approximate total: cached per filter and recounted in the background
+        total_count = count_cache.get(db.payments, filter_query, hint)
+
+        return jsonify(transactions_page(transactions, total_count, limit, next_cursor, prev_cursor)), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching transactions: {str(e)}'}), 500
 
+# $group keys and sort for the revenue charts over sales_daily
+MONTHLY_GROUP = {'year': {'$year': '$day'}, 'month': {'$month': '$day'}}
+WEEKLY_GROUP = {'year': {'$year': '$day'}, 'week': {'$week': '$day'}}
+WEEKLY_SORT = {'_id.year': -1, '_id.week': -1}
+WEEKLY_LIMIT = 12  # Get last 12 weeks
+
+def monthly_revenue_rows(monthly_results):
+    """Convert to frontend format, convert paise to rupees"""
+    revenue_data = []
+    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
+                  'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+    for result in monthly_results:
+        month_num = result['_id']['month']
+        revenue_rupees = float(result.get('amount') or 0)
+
+        revenue_data.append({
+            'month': month_names[month_num - 1],
+            'revenue': round(revenue_rupees, 2)
+        })
+    return revenue_data
+
+def weekly_revenue_filter(status_filter, date_filter):
+    """compile_rollup_filter() defaulting to Completed payments without a
+    status and to the current year without a date"""
+    if not status_filter or status_filter == 'All':
+        status_filter = COMPLETED
+    match_stage, hint = compile_rollup_filter(status_filter, date_filter)
+    if 'day' not in match_stage:
+        current_year = datetime.now().year
+        match_stage['day'] = {'$gte': datetime(current_year, 1, 1), '$lt': datetime(current_year + 1, 1, 1)}
+        hint = ROLLUP_INDEX
+    return match_stage, hint
+
+def weekly_revenue_rows(weekly_results):
+    """Chronological frontend rows from the newest-first weekly buckets"""
+    revenue_data = []
+    for result in reversed(weekly_results):
+        week_num = result['_id']['week']
+        revenue_rupees = float(result.get('amount') or 0)
+
+        revenue_data.append({
+            'week': f'Week {week_num}',
+            'revenue': round(revenue_rupees, 2)
+        })
+    return revenue_data
+
 @admin_bp.route('/admin/payments/monthly_revenue', methods=['GET'])
 def get_monthly_revenue():
     db = get_db()
     try:
-        # Get query parameters for filtering
-        status_filter = request.args.get('status', 'All')
-        date_filter = request.args.get('date', 'All')
-        
-        # Build filter query
-        filter_query = {}
-        
-        if status_filter != 'All':
-            filter_query['payment_status'] = status_filter
-        
-        if date_filter != 'All':
-            if date_filter == 'Today':
-                today = datetime.now().strftime('%Y-%m-%d')
-                filter_query['transaction_date'] = {'$regex': today}
-            elif date_filter == 'This Month':
-                current_month = datetime.now().strftime('%Y-%m')
-                filter_query['transaction_date'] = {'$regex': current_month}
-        
-        # Build match conditions for pipeline (handle status and date filters reliably)
-        from datetime import timedelta
-        match_conditions = {}
-
-        # Normalize status filter: if provided, map common "completed" labels to actual DB values
-        if status_filter != 'All':
-            sf = status_filter.lower()
-            if sf in ('completed', 'paid', 'success'):
-                # match any of the common success labels
-                match_conditions['payment_status'] = {'$in': ['success', 'paid', 'Completed', 'Paid', 'completed', 'Success']}
-            else:
-                match_conditions['payment_status'] = status_filter
-
-        # Date filter: convert tokens or explicit YYYY-MM(-DD) into a date range on payDate
-        date_range = {}
-        now = datetime.now()
-        if date_filter != 'All':
-            if date_filter == 'Today':
-                start = datetime(now.year, now.month, now.day)
-                end = start + timedelta(days=1)
-                date_range = {'$gte': start, '$lt': end}
-            elif date_filter == 'This Month':
-                start = datetime(now.year, now.month, 1)
-                # get start of next month
-                if now.month == 12:
-                    end = datetime(now.year + 1, 1, 1)
-                else:
-                    end = datetime(now.year, now.month + 1, 1)
-                date_range = {'$gte': start, '$lt': end}
-            else:
-                # YYYY-MM-DD or YYYY-MM
-                try:
-                    if len(date_filter) == 10:
-                        parts = [int(x) for x in date_filter.split('-')]
-                        start = datetime(parts[0], parts[1], parts[2])
-                        end = start + timedelta(days=1)
-                        date_range = {'$gte': start, '$lt': end}
-                    elif len(date_filter) == 7:
-                        parts = [int(x) for x in date_filter.split('-')]
-                        start = datetime(parts[0], parts[1], 1)
-                        if parts[1] == 12:
-                            end = datetime(parts[0] + 1, 1, 1)
-                        else:
-                            end = datetime(parts[0], parts[1] + 1, 1)
-                        date_range = {'$gte': start, '$lt': end}
-                except Exception:
-                    date_range = {}
-
-        # Aggregate payments by month for the current year (or filtered range)
-        pipeline = [
-            {'$addFields': {
-                'payDate': {
-                    '$cond': [
-                        {'$eq': [{'$type': '$created_at'}, 'date']},
-                        '$created_at',
-                        {'$toDate': '$created_at'}
-                    ]
-                }
-            }},
-        ]
-
-        # Build the $match stage
-        match_stage = {}
-        if match_conditions:
-            match_stage.update(match_conditions)
-
-        # If date_range exists, apply it on payDate
-        if date_range:
-            match_stage['payDate'] = date_range
-
-        # If match_stage has entries, add to pipeline
-        if match_stage:
-            pipeline.append({'$match': match_stage})
-
-        # Group by year+month
-        pipeline.extend([
-            {'$group': {
-                '_id': {
-                    'year': {'$year': '$payDate'},
-                    'month': {'$month': '$payDate'}
-                },
-                'total_revenue': {'$sum': '$amount'},
-                'transaction_count': {'$sum': 1}
-            }},
-            {'$sort': {'_id.month': 1}}
-        ])
-
-        monthly_results = list(db.payments.aggregate(pipeline))
-
-        # Convert to frontend format, convert paise to rupees
-        revenue_data = []
-        month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                      'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-
-        for result in monthly_results:
-            month_num = result['_id']['month']
-            total_revenue = result.get('total_revenue', 0) or 0
-            try:
-                revenue_rupees = float(total_revenue)
-            except Exception:
-                revenue_rupees = float(total_revenue)
+        try:
+            match_stage, hint = compile_rollup_filter(request.args.get('status', 'All'),
+                                                      request.args.get('date', 'All'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
 
-            revenue_data.append({
-                'month': month_names[month_num - 1],
-                'revenue': round(revenue_rupees, 2)
-            })
+        # Aggregate the daily rollup by month (or filtered range)
+        monthly_results = sales_by(db, match_stage, MONTHLY_GROUP, sort={'_id.month': 1}, hint=hint)
 
-        return jsonify({'monthly_revenue': revenue_data}), 200
+        return jsonify({'monthly_revenue': monthly_revenue_rows(monthly_results)}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching monthly revenue: {str(e)}'}), 500
 
@@ -779,129 +836,87 @@ def get_monthly_revenue():
 def get_weekly_revenue():
     db = get_db()
     try:
-        # Get query parameters for filtering
-        status_filter = request.args.get('status', 'All')
-        date_filter = request.args.get('date', 'All')
-        
-        # Build filter query
-        filter_query = {}
-        
-        if status_filter != 'All':
-            filter_query['payment_status'] = status_filter
-        
-        if date_filter != 'All':
-            if date_filter == 'Today':
-                today = datetime.now().strftime('%Y-%m-%d')
-                filter_query['transaction_date'] = {'$regex': today}
-            elif date_filter == 'This Month':
-                current_month = datetime.now().strftime('%Y-%m')
-                filter_query['transaction_date'] = {'$regex': current_month}
-        
-        # Calculate the start of the current year
-        current_year = datetime.now().year
-        year_start = datetime(current_year, 1, 1)
-
-        # Aggregate payments by week for the current year
-        pipeline = [
-            {'$addFields': {
-                'payDate': {
-                    '$cond': [
-                        {'$eq': [{'$type': '$created_at'}, 'date']},
-                        '$created_at',
-                        {'$toDate': '$created_at'}
-                    ]
-                }
-            }},
-            {'$match': {
-                **filter_query,
-                'payment_status': 'Completed',
-                'payDate': {
-                    '$gte': year_start,
-                    '$lt': datetime(current_year + 1, 1, 1)
-                }
-            }},
-            {'$group': {
-                '_id': {
-                    'year': {'$year': '$payDate'},
-                    'week': {'$week': '$payDate'}
-                },
-                'total_revenue': {'$sum': '$amount'},
-                'transaction_count': {'$sum': 1}
-            }},
-            {'$sort': {'_id.week': 1}},
-            {'$limit': 12}  # Get last 12 weeks
-        ]
-
-        weekly_results = list(db.payments.aggregate(pipeline))
+        try:
+            match_stage, hint = weekly_revenue_filter(request.args.get('status', 'All'),
+                                                      request.args.get('date', 'All'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        # Aggregate the daily rollup by week
+        weekly_results = sales_by(db, match_stage, WEEKLY_GROUP, sort=WEEKLY_SORT, limit=WEEKLY_LIMIT, hint=hint)
+        return jsonify({'weekly_revenue': weekly_revenue_rows(weekly_results)}), 200
+    except Exception as e:
+        return jsonify({'message': f'Error fetching weekly revenue: {str(e)}'}), 500
 
-        # Convert to frontend format (convert paise to rupees)
-        revenue_data = []
-        for result in weekly_results:
-            week_num = result['_id']['week']
-            total_revenue = result.get('total_revenue', 0) or 0
+def summarize_payments_stream(db, match, hint=None):
+    """Constant-memory summary over a cursor, for amounts $sum cannot add
+    (legacy rows storing the amount as a string)."""
+    total_revenue = 0.0
+    total_transactions = 0
+    successful_transactions = 0
+    cursor = db.payments.find(match, {'_id': 0, 'amount': 1, 'payment_status': 1}, batch_size=1000)
+    if hint:
+        cursor = cursor.hint(hint)
+    for p in cursor:
+        total_transactions += 1
+        if p.get('payment_status') in STATUS_VALUES[COMPLETED]:
+            successful_transactions += 1
             try:
-                revenue_rupees = float(total_revenue)
-            except Exception:
-                revenue_rupees = float(total_revenue)
+                total_revenue += float(p.get('amount') or 0)
+            except (TypeError, ValueError):
+                pass
+    return total_revenue, total_transactions, successful_transactions
+
+
+def summary_pipeline(match):
+    completed = {'$in': ['$payment_status', list(STATUS_VALUES[COMPLETED])]}
+    return [
+        {'$match': match},
+        {'$group': {
+            '_id': None,
+            'total_transactions': {'$sum': 1},
+            'successful_transactions': {'$sum': {'$cond': [completed, 1, 0]}},
+            'total_revenue': {'$sum': {'$cond': [completed, '$amount', 0]}},
+            # $sum skips strings; rows storing one need the streaming path
+            'unsummable': {'$sum': {'$cond': [
+                {'$and': [completed, {'$eq': [{'$type': '$amount'}, 'string']}]}, 1, 0
+            ]}}
+        }}
+    ]
 
-            revenue_data.append({
-                'week': f'Week {week_num}',
-                'revenue': round(revenue_rupees, 2)
-            })
+def payments_summary(total_revenue, total_transactions, successful_transactions):
+    success_rate = (successful_transactions / total_transactions * 100) if total_transactions > 0 else 0
+    return {
+        'total_revenue': round(total_revenue, 2),
+        'total_transactions': total_transactions,
+        'successful_transactions': successful_transactions,
+        'success_rate': round(success_rate, 1)
+    }
 
-        return jsonify({'weekly_revenue': revenue_data}), 200
-    except Exception as e:
-        return jsonify({'message': f'Error fetching weekly revenue: {str(e)}'}), 500
+def payments_summary_from_totals(totals):
+    """payments_summary() from the summary_pipeline() result document"""
+    return payments_summary(
+        float(totals.get('total_revenue') or 0),
+        totals.get('total_transactions', 0),
+        totals.get('successful_transactions', 0)
+    )
 
 @admin_bp.route('/admin/payments/summary', methods=['GET'])
 def get_payments_summary():
     db = get_db()
     try:
-        # Get query parameters for filtering
-        status_filter = request.args.get('status', 'All')
-        date_filter = request.args.get('date', 'All')
-        
-        # Build filter query
-        filter_query = {}
-        
-        if status_filter != 'All':
-            filter_query['payment_status'] = status_filter
-        
-        if date_filter != 'All':
-            if date_filter == 'Today':
-                today = datetime.now().strftime('%Y-%m-%d')
-                filter_query['transaction_date'] = {'$regex': today}
-            elif date_filter == 'This Month':
-                current_month = datetime.now().strftime('%Y-%m')
-                filter_query['transaction_date'] = {'$regex': current_month}
-        
-        # Get filtered payments
-        filtered_payments = list(db.payments.find(filter_query))
-
-        # Calculate summary statistics (amounts are already in rupees)
-        total_revenue = sum(p.get('amount', 0) for p in filtered_payments if p.get('payment_status') == 'Completed')
         try:
-            total_revenue = float(total_revenue)
-        except Exception:
-            total_revenue = 0.0
-
-        total_transactions = len(filtered_payments)
-        successful_transactions = len([p for p in filtered_payments if p.get('payment_status') == 'Completed'])
-        success_rate = (successful_transactions / total_transactions * 100) if total_transactions > 0 else 0
-
-        summary = {
-            'total_revenue': round(total_revenue, 2),
-            'total_transactions': total_transactions,
-            'successful_transactions': successful_transactions,
-            'success_rate': round(success_rate, 1)
-        }
-
-        return jsonify(summary), 200
+            match, hint = compile_payment_filter(request.args.get('status', 'All'),
+                                                 request.args.get('date', 'All'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        options = {'hint': hint} if hint else {}
+        result = list(db.payments.aggregate(summary_pipeline(match), **options))
+        totals = result[0] if result else {}
+
+        if totals.get('unsummable'):
+            return jsonify(payments_summary(*summarize_payments_stream(db, match, hint))), 200
+        return jsonify(payments_summary_from_totals(totals)), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching payments summary: {str(e)}'}), 500
-
-
-
-
-
-
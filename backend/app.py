@@ -2,13 +2,58 @@ from flask import Flask
 from admin import admin_bp
 from users import users_bp
 from flask_cors import CORS
+from db import get_db
+from json_provider import MongoJSONProvider
+from migrations import db_cli, run_migrations
+from reconciler import payments_cli, start_reconciler
+import os
 
-app = Flask(__name__)
-CORS(app)
 
-# Register blueprints
-app.register_blueprint(admin_bp)
-app.register_blueprint(users_bp)
+def create_app(config=None):
+    """Build the Flask application.
+
+    config overrides the defaults below:
+        MONGO_AUTO_MIGRATE  apply pending migrations while building the app
+        START_BACKGROUND    start background threads (the payment reconciler)
+                            in this process; pre-forking servers turn this off
+                            and start them in each worker instead
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(
+        MONGO_AUTO_MIGRATE=os.getenv('MONGO_AUTO_MIGRATE', '1') == '1',
+        START_BACKGROUND=True,
+    )
+    if config:
+        app.config.from_mapping(config)
+
+    # Encodes ObjectId and datetime values in query results directly
+    app.json = MongoJSONProvider(app)
+    CORS(app)
+
+    # Register blueprints
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(users_bp)
+
+    # Database maintenance commands (flask --app app db migrate|drift)
+    app.cli.add_command(db_cli)
+    # Payment maintenance commands (flask --app app payments reconcile)
+    app.cli.add_command(payments_cli)
+
+    # Build indexes and apply pending migrations at startup unless disabled
+    if app.config['MONGO_AUTO_MIGRATE']:
+        with app.app_context():
+            try:
+                run_migrations(get_db())
+            except Exception as e:
+                app.logger.warning(f'Database migrations failed: {e}')
+
+    # Background refresh of pending Stripe payments (PAYMENT_RECONCILER_ENABLED=1)
+    if app.config['START_BACKGROUND']:
+        start_reconciler()
+
+    return app
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only; see wsgi.py for production serving
+    create_app().run(debug=True)
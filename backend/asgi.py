@@ -0,0 +1,80 @@
+"""ASGI entry point: asyncio views for the I/O-bound endpoints, Flask for the rest.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Requests whose path and method match a route in async_routes.py are served
+by a Quart app on the event loop, so one process can keep many Mongo and
+Stripe calls in flight. Every other request goes to the Flask app from
+create_app() through asgiref's WSGI adapter, run on a pool of
+ASGI_FLASK_THREADS threads (asgiref alone would queue them all on a single
+thread). Clients see the same URLs and payloads as with wsgi.py.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from quart import Quart
+from quart_cors import cors
+from werkzeug.exceptions import HTTPException
+import stripe
+
+from app import create_app
+from async_db import close_async_client
+from async_routes import async_bp
+from json_provider import MongoJSONProvider
+
+# Stripe's *_async calls need an asyncio HTTP client
+stripe.default_http_client = stripe.HTTPXClient()
+
+flask_app = create_app()
+
+async_app = Quart(__name__)
+async_app.json = MongoJSONProvider(async_app)
+async_app.register_blueprint(async_bp)
+cors(async_app, allow_origin='*')
+
+
+@async_app.after_serving
+async def close_mongo():
+    await close_async_client()
+
+
+# Like gunicorn's gthread workers: Flask views block on Mongo, so each
+# concurrent request needs its own thread
+ASGI_FLASK_THREADS = int(os.getenv('ASGI_FLASK_THREADS', 32))
+_flask_pool = ThreadPoolExecutor(max_workers=ASGI_FLASK_THREADS, thread_name_prefix='flask')
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    # asgiref's default is thread_sensitive=True: one shared thread per process
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+                                 thread_sensitive=False, executor=_flask_pool)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi running each request on a thread of _flask_pool."""
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+_flask_asgi = PooledWsgiToAsgi(flask_app)
+_async_routes = async_app.url_map.bind('localhost')
+
+
+def _is_async(scope):
+    try:
+        _async_routes.match(scope['path'], scope['method'])
+    except HTTPException:
+        return False
+    return True
+
+
+async def app(scope, receive, send):
+    # Lifespan events go to Quart, which opens and closes the async client
+    if scope['type'] == 'http' and not _is_async(scope):
+        await _flask_asgi(scope, receive, send)
+    else:
+        await async_app(scope, receive, send)
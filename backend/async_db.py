@@ -0,0 +1,48 @@
+"""asyncio MongoDB access for the ASGI serving mode (asgi.py).
+
+Mirrors db.py with pymongo's AsyncMongoClient: one client per process, with
+the same pool settings, so a single event loop can keep many queries in
+flight without a thread per request. The client belongs to the event loop it
+first runs on; asgi.py closes it when the server shuts down.
+"""
+
+from pymongo import AsyncMongoClient
+import os
+
+from db import DB_NAME, _pool_options, supports_transactions
+
+_client = None
+_client_pid = None
+
+
+def get_async_client():
+    """Return this process's AsyncMongoClient, creating it on first use."""
+    global _client, _client_pid
+    pid = os.getpid()
+    # Only the event loop thread calls this, so no lock is needed
+    if _client is None or _client_pid != pid:
+        _client = AsyncMongoClient(os.getenv('MONGO_URI'), connect=False, **_pool_options())
+        _client_pid = pid
+    return _client
+
+
+async def close_async_client():
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        await _client.close()
+    _client = None
+    _client_pid = None
+
+
+def get_async_database():
+    return get_async_client()[DB_NAME]
+
+
+async def run_in_transaction_async(callback):
+    """Await callback(session) inside a multi-document transaction, or
+    callback(None) on a standalone server (see db.run_in_transaction)."""
+    client = get_async_client()
+    if not supports_transactions(client):
+        return await callback(None)
+    async with client.start_session() as session:
+        return await session.with_transaction(callback)
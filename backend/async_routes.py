@@ -0,0 +1,254 @@
+"""asyncio versions of the I/O-bound endpoints, served by asgi.py.
+
+Each view answers the same URL with the same payload as its Flask
+counterpart in users.py / admin.py, but awaits Mongo (AsyncMongoClient) and
+Stripe (its async API over httpx) instead of holding a worker thread, and
+sends independent queries together:
+
+    /users/orders/place_order          cart and customer reads, commit writes
+    /users/payment-status/<id>         transaction and rollup writes
+    /admin/dashboard/overview          all five metrics
+    /admin/payments/transactions       the page and its total count
+    /admin/payments/summary, monthly_revenue, weekly_revenue
+
+Every other endpoint is served by the Flask app.
+"""
+
+from datetime import datetime
+import asyncio
+import time
+
+from quart import Blueprint, current_app, jsonify, request
+import stripe
+
+import admin
+import checkout
+import payments
+from async_db import get_async_database
+from cache import count_cache, get_user_names_async, payment_status_cache
+from db import get_database
+from filters import compile_payment_filter, compile_rollup_filter
+from pagination import keyset_page_async
+from rollups import sales_by_async
+from users import STRIPE_WEBHOOK_SECRET
+
+async_bp = Blueprint('async', __name__)
+
+
+async def _first(cursor):
+    """First document of an aggregation, or None."""
+    result = await (await cursor).to_list(1)
+    return result[0] if result else None
+
+
+def _with_etag(body, etag):
+    """Send body with its ETag, or 304 when the client already has it (as
+    conditional.conditional() does for the Flask views)."""
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class('', status=304)
+    else:
+        response = jsonify(body)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# ------------------ Orders and payments ------------------
+@async_bp.route('/users/orders/place_order', methods=['POST'])
+async def place_order():
+    data = await request.get_json()
+    required_fields = ['phone_number', 'payment_method', 'billing_address']
+    if not data or not all(field in data for field in required_fields):
+        return jsonify({'message': 'Missing required fields'}), 400
+
+    db = get_async_database()
+
+    try:
+        result, timings = await checkout.place_order_async(
+            db,
+            data['phone_number'],
+            data['payment_method'],
+            data.get('billing_address', '')
+        )
+        # Per-stage timing breakdown in debug mode
+        if current_app.debug:
+            result['timings_ms'] = timings
+        return jsonify(result), 201
+
+    except checkout.CheckoutError as e:
+        return jsonify({'message': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'message': f'Error placing order: {str(e)}'}), 500
+
+
+@async_bp.route('/users/payment-status/<session_id>', methods=['GET'])
+async def get_payment_status(session_id):
+    """Check the status of a payment session"""
+    try:
+        db = get_async_database()
+        payment_record = await db.payments.find_one({'session_id': session_id})
+
+        # Webhook-maintained and terminal payments are answered locally
+        if payment_record and (STRIPE_WEBHOOK_SECRET
+                               or payment_record.get('payment_status') in payments.TERMINAL_STATUSES):
+            return jsonify(payments.local_status_response(payment_record)), 200
+
+        # Pending sessions reach Stripe at most once per STRIPE_POLL_MIN_INTERVAL
+        found, cached_response = payment_status_cache.lookup(session_id)
+        if found:
+            return jsonify(cached_response), 200
+
+        session = await stripe.checkout.Session.retrieve_async(session_id)
+
+        # UPI sessions may not be 'paid' yet; the PaymentIntent tells more
+        pi_status = None
+        payment_intent_id = getattr(session, 'payment_intent', None)
+        if getattr(session, 'payment_status', None) != 'paid' and payment_intent_id:
+            try:
+                pi = await stripe.PaymentIntent.retrieve_async(payment_intent_id)
+                pi_status = getattr(pi, 'status', None)
+            except Exception:
+                pi_status = None
+
+        state = payments.session_state(session, pi_status)
+        if payment_record:
+            await payments.apply_payment_state_async(db, payment_record, state)
+
+        response = payments.session_status_response(session_id, state)
+        if state['payment_status'] not in payments.TERMINAL_STATUSES:
+            payment_status_cache.set(session_id, response)
+        return jsonify(response), 200
+
+    except Exception as e:
+        if 'stripe' in str(e).lower() or hasattr(e, 'user_message'):
+            return jsonify({'error': f'Stripe error: {str(e)}', 'success': False}), 400
+        return jsonify({'error': f'Failed to retrieve payment status: {str(e)}', 'success': False}), 500
+
+
+# ------------------ Admin dashboard ------------------
+async def _weekly_sales(db):
+    today = datetime.now().date()
+    return admin.weekly_sales_series(await sales_by_async(db, admin.weekly_sales_match(today), '$day'), today)
+
+
+async def _user_count(db):
+    return await db.users.count_documents(admin.USER_COUNT_FILTER)
+
+
+async def _delivered_orders_count(db):
+    return await db.orders.count_documents(admin.DELIVERED_ORDERS_FILTER)
+
+
+async def _total_sales(db):
+    result = await _first(db.orders.aggregate(admin.TOTAL_SALES_PIPELINE))
+    return result['total'] if result else 0
+
+
+async def _inventory_value(db):
+    result = await _first(db.products.aggregate(admin.INVENTORY_VALUE_PIPELINE))
+    return result['total_inventory_value'] if result else 0
+
+
+# Same keys as admin.DASHBOARD_METRICS
+DASHBOARD_METRICS = {
+    'sales_data': _weekly_sales,
+    'user_count': _user_count,
+    'delivered_orders_count': _delivered_orders_count,
+    'total_sales': _total_sales,
+    'total_inventory_value': _inventory_value,
+}
+
+
+async def _timed(metric, db):
+    started = time.perf_counter()
+    value = await metric(db)
+    return value, round((time.perf_counter() - started) * 1000, 2)
+
+
+@async_bp.route('/admin/dashboard/overview', methods=['GET'])
+async def get_dashboard_overview():
+    db = get_async_database()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_timed(metric, db) for metric in DASHBOARD_METRICS.values()),
+                                   return_exceptions=True)
+    overview, etag = admin.dashboard_overview(dict(zip(DASHBOARD_METRICS, results)), started)
+    return _with_etag(overview, etag)
+
+
+# ------------------ Admin payments ------------------
+@async_bp.route('/admin/payments/transactions', methods=['GET'])
+async def get_transactions():
+    db = get_async_database()
+    try:
+        try:
+            limit = admin.page_limit(request.args.get('limit'))
+            filter_query, hint = compile_payment_filter(request.args.get('status', 'All'),
+                                                        request.args.get('date', 'All'))
+            (rows, next_cursor, prev_cursor), total_count = await asyncio.gather(
+                keyset_page_async(db.payments, filter_query, admin.TRANSACTIONS_SORT, limit,
+                                  cursor=request.args.get('cursor'), hint=hint),
+                count_cache.get_async(db.payments, filter_query, hint)
+            )
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        customer_names = await get_user_names_async(db, [p['user_id'] for p in rows if p.get('user_id')])
+        transactions = [admin.transaction_row(p, customer_names) for p in rows]
+        return jsonify(admin.transactions_page(transactions, total_count, limit, next_cursor, prev_cursor)), 200
+    except Exception as e:
+        return jsonify({'message': f'Error fetching transactions: {str(e)}'}), 500
+
+
+@async_bp.route('/admin/payments/summary', methods=['GET'])
+async def get_payments_summary():
+    db = get_async_database()
+    try:
+        try:
+            match, hint = compile_payment_filter(request.args.get('status', 'All'),
+                                                 request.args.get('date', 'All'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        options = {'hint': hint} if hint else {}
+        totals = await _first(db.payments.aggregate(admin.summary_pipeline(match), **options)) or {}
+        if totals.get('unsummable'):
+            # Rare legacy rows: stream them with the sync driver off the event loop
+            stream = await asyncio.to_thread(admin.summarize_payments_stream, get_database(), match, hint)
+            return jsonify(admin.payments_summary(*stream)), 200
+        return jsonify(admin.payments_summary_from_totals(totals)), 200
+    except Exception as e:
+        return jsonify({'message': f'Error fetching payments summary: {str(e)}'}), 500
+
+
+@async_bp.route('/admin/payments/monthly_revenue', methods=['GET'])
+async def get_monthly_revenue():
+    db = get_async_database()
+    try:
+        try:
+            match_stage, hint = compile_rollup_filter(request.args.get('status', 'All'),
+                                                      request.args.get('date', 'All'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        monthly_results = await sales_by_async(db, match_stage, admin.MONTHLY_GROUP,
+                                               sort={'_id.month': 1}, hint=hint)
+        return jsonify({'monthly_revenue': admin.monthly_revenue_rows(monthly_results)}), 200
+    except Exception as e:
+        return jsonify({'message': f'Error fetching monthly revenue: {str(e)}'}), 500
+
+
+@async_bp.route('/admin/payments/weekly_revenue', methods=['GET'])
+async def get_weekly_revenue():
+    db = get_async_database()
+    try:
+        try:
+            match_stage, hint = admin.weekly_revenue_filter(request.args.get('status', 'All'),
+                                                            request.args.get('date', 'All'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        weekly_results = await sales_by_async(db, match_stage, admin.WEEKLY_GROUP, sort=admin.WEEKLY_SORT,
+                                              limit=admin.WEEKLY_LIMIT, hint=hint)
+        return jsonify({'weekly_revenue': admin.weekly_revenue_rows(weekly_results)}), 200
+    except Exception as e:
+        return jsonify({'message': f'Error fetching weekly revenue: {str(e)}'}), 500
@@ -0,0 +1,105 @@
+"""Benchmark JSON encoding of the order-history payload.
+
+Compares the old path (a strftime loop over every order, then Flask's default
+provider) with MongoJSONProvider on a synthetic /users/orders/get_orders
+response shaped like real orders:
+
+    python bench_json.py --orders 500 --items 8 --repeat 50
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import time
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import MongoJSONProvider, orjson
+
+
+def build_orders(count, items):
+    now = datetime.now()
+    orders = []
+    for i in range(count):
+        placed = now - timedelta(hours=i)
+        orders.append({
+            'user_id': '9876543210',
+            'customer_name': 'Test Customer',
+            'order_date': placed,
+            'order_date_string': placed.strftime('%Y-%m-%d %H:%M:%S'),
+            'order_timestamp': placed.timestamp(),
+            'products': [{
+                'product_id': f'890{i:05d}{j:02d}',
+                'name': f'Product {j}',
+                'price': 120.0 + j,
+                'discount_price': 108.0 + j,
+                'discount_percentage': 10,
+                'discount_name': 'Festive',
+                'quantity': j + 1,
+                'item_total': (108.0 + j) * (j + 1),
+                'original_total': (120.0 + j) * (j + 1)
+            } for j in range(items)],
+            'total_amount': 1234.5,
+            'original_total_amount': 1371.0,
+            'total_savings': 136.5,
+            'payment_method': 'UPI',
+            'billing_address': '',
+            'order_status': 'Completed',
+            'payment_status': 'Completed',
+            'delivery_status': 'Done',
+            'created_at': placed,
+            'updated_at': placed,
+            'payment_id': ObjectId()
+        })
+    return orders
+
+
+def legacy_encode(provider, orders):
+    # What get_user_orders did before: convert each date field, then jsonify
+    for order in orders:
+        for field in ('order_date', 'created_at', 'updated_at'):
+            if field in order and isinstance(order[field], datetime):
+                order[field] = order[field].strftime('%Y-%m-%d %H:%M:%S')
+        order['payment_id'] = str(order['payment_id'])
+    return provider.dumps({'orders': orders}, separators=(',', ':'))
+
+
+def provider_encode(provider, orders):
+    return provider.dumps({'orders': orders}, separators=(',', ':'))
+
+
+def timed(fn, provider, orders, repeat, copy):
+    best = None
+    for _ in range(repeat):
+        # The legacy path mutates its input, so each run gets fresh documents
+        data = copy(orders)
+        started = time.perf_counter()
+        fn(provider, data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark order-history JSON encoding.')
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--items', type=int, default=8, help='products per order')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    orders = build_orders(args.orders, args.items)
+    copy = lambda docs: [dict(doc) for doc in docs]
+
+    legacy = timed(legacy_encode, DefaultJSONProvider(app), orders, args.repeat, copy)
+    fast = timed(provider_encode, MongoJSONProvider(app), orders, args.repeat, copy)
+
+    print(f'{args.orders} orders x {args.items} items, best of {args.repeat}')
+    print(f'  strftime loop + default provider: {legacy * 1000:8.2f} ms')
+    print(f'  MongoJSONProvider ({"orjson" if orjson else "stdlib"}):  {fast * 1000:8.2f} ms')
+    print(f'  speedup: {legacy / fast:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,474 @@
+"""In-process caches for hot read paths.
+
+Each worker process keeps its own copy. Writes made through this process
+invalidate immediately; other workers pick changes up when the TTL expires.
+"""
+
+from collections import OrderedDict
+import asyncio
+import os
+import threading
+import time
+
+from bson import json_util
+from werkzeug.http import generate_etag
+
+DISCOUNT_CACHE_TTL = float(os.getenv('DISCOUNT_CACHE_TTL', 60))
+PRODUCT_CACHE_SIZE = int(os.getenv('PRODUCT_CACHE_SIZE', 5000))
+PRODUCT_CACHE_TTL = float(os.getenv('PRODUCT_CACHE_TTL', 300))
+USER_NAME_CACHE_SIZE = int(os.getenv('USER_NAME_CACHE_SIZE', 10000))
+USER_NAME_CACHE_TTL = float(os.getenv('USER_NAME_CACHE_TTL', 600))
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', 60))
+# Minimum seconds between Stripe lookups for the same pending session
+STRIPE_POLL_MIN_INTERVAL = float(os.getenv('STRIPE_POLL_MIN_INTERVAL', 5))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds.
+
+    None is a valid cached value, which lets callers cache negative results.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """Return (found, value)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Remove key and return its cached value (None if absent)."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class DiscountIndex:
+    """Snapshot of the Active discounts, keyed by str(_id) and by barcode.
+
+    The whole set is reloaded with one query when the TTL expires or after
+    invalidate() is called by an admin write, so pricing never has to query
+    the discounts collection on the request path.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_barcode = {}
+        self._loaded_at = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def get(self, db):
+        """Return (by_id, by_barcode), reloading from db if stale."""
+        if self._fresh():
+            self.hits += 1
+            return self._by_id, self._by_barcode
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock.
+            if self._fresh():
+                self.hits += 1
+                return self._by_id, self._by_barcode
+            self.misses += 1
+            version = self.version
+            return self._load(db.discounts.find({'status': 'Active'}), version)
+
+    async def get_async(self, db):
+        """get() for an asyncio (AsyncMongoClient) database. Reloads are not
+        serialized across coroutines; each is the same single query."""
+        if self._fresh():
+            self.hits += 1
+            return self._by_id, self._by_barcode
+        self.misses += 1
+        version = self.version
+        return self._load(await db.discounts.find({'status': 'Active'}).to_list(), version)
+
+    def _load(self, discounts, version):
+        by_id = {}
+        by_barcode = {}
+        for discount in discounts:
+            by_id[str(discount['_id'])] = discount
+            if 'product_barcode' in discount:
+                by_barcode.setdefault(discount['product_barcode'], discount)
+        self._by_id, self._by_barcode = by_id, by_barcode
+        # An invalidation that raced with the load leaves the snapshot stale.
+        if version == self.version:
+            self._loaded_at = time.monotonic()
+        return by_id, by_barcode
+
+    def invalidate(self):
+        self.version += 1
+        self.invalidations += 1
+        self._loaded_at = None
+
+    def stats(self):
+        return {
+            'entries': len(self._by_id),
+            'version': self.version,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+class CachedResponse:
+    """A single serialized response body, reused until it expires or is
+    invalidated. Like DiscountIndex, a body built while an invalidation raced
+    with it is not stored."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._body = None
+        self._etag = None
+        self._expires_at = 0
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self):
+        body = self._body
+        if body is not None and time.monotonic() < self._expires_at:
+            self.hits += 1
+            return body
+        self.misses += 1
+        return None
+
+    def etag(self):
+        """ETag of the cached body (the hash Werkzeug's add_etag would use),
+        or None when nothing fresh is cached."""
+        etag = self._etag
+        if etag is not None and time.monotonic() < self._expires_at:
+            return etag
+        return None
+
+    def set(self, body, version, ttl=None):
+        """Store body built from data read at version; ttl may shorten the default."""
+        if version != self.version:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._body = body
+        self._etag = generate_etag(body.encode('utf-8'))
+        self._expires_at = time.monotonic() + ttl
+
+    def invalidate(self):
+        self.version += 1
+        self.invalidations += 1
+        self._body = None
+        self._etag = None
+
+    def stats(self):
+        return {
+            'cached': self._body is not None and time.monotonic() < self._expires_at,
+            'version': self.version,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+class CountCache:
+    """Document counts per (collection, filter), refreshed in the background.
+
+    A count younger than ttl is returned as is. An older one is still
+    returned while a single background thread recounts, so only the first
+    request for a filter ever waits for count_documents. Unfiltered counts
+    come from the collection metadata (estimated_document_count).
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._refreshing = set()
+        # Recounts started by get_async(), referenced until they finish
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def _count(collection, query, hint=None):
+        if not query:
+            return collection.estimated_document_count()
+        if hint:
+            return collection.count_documents(query, hint=hint)
+        return collection.count_documents(query)
+
+    @staticmethod
+    async def _count_async(collection, query, hint=None):
+        if not query:
+            return await collection.estimated_document_count()
+        if hint:
+            return await collection.count_documents(query, hint=hint)
+        return await collection.count_documents(query)
+
+    def _store(self, key, count):
+        with self._lock:
+            self._data[key] = (count, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _refresh(self, key, collection, query, hint):
+        try:
+            self._store(key, self._count(collection, query, hint))
+        except Exception:
+            # Keep serving the previous count; the next request retries
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _refresh_async(self, key, collection, query, hint):
+        try:
+            self._store(key, await self._count_async(collection, query, hint))
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _cached(self, key):
+        """Return (found, count, refresh); refresh means the entry is stale and
+        the caller must start its recount."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None, False
+            self._data.move_to_end(key)
+            self.hits += 1
+            count, counted_at = entry
+            refresh = time.monotonic() - counted_at >= self.ttl and key not in self._refreshing
+            if refresh:
+                self._refreshing.add(key)
+                self.refreshes += 1
+            return True, count, refresh
+
+    def get(self, collection, query, hint=None):
+        key = (collection.full_name, json_util.dumps(query, sort_keys=True))
+        found, count, refresh = self._cached(key)
+        if refresh:
+            threading.Thread(target=self._refresh, args=(key, collection, query, hint), daemon=True).start()
+        if found:
+            return count
+        count = self._count(collection, query, hint)
+        self._store(key, count)
+        return count
+
+    async def get_async(self, collection, query, hint=None):
+        """get() for an asyncio (AsyncMongoClient) collection; stale entries
+        are recounted in a task on the running loop."""
+        key = (collection.full_name, json_util.dumps(query, sort_keys=True))
+        found, count, refresh = self._cached(key)
+        if refresh:
+            task = asyncio.create_task(self._refresh_async(key, collection, query, hint))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if found:
+            return count
+        count = await self._count_async(collection, query, hint)
+        self._store(key, count)
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes
+        }
+
+
+discount_index = DiscountIndex(DISCOUNT_CACHE_TTL)
+
+# Serialized /users/view_discounts payload (discounts joined to products)
+discount_view = CachedResponse(DISCOUNT_CACHE_TTL)
+
+
+def invalidate_discounts():
+    """Call after any write to the discounts collection."""
+    discount_index.invalidate()
+    discount_view.invalidate()
+
+
+def invalidate_discount_view():
+    """Call after product writes that change what view_discounts shows
+    (new or deleted products, name, barcode, price or discount_id)."""
+    discount_view.invalidate()
+
+
+# Product documents keyed by both product_id and barcode. Unknown identifiers
+# are cached as None so repeated scans of a bad barcode skip the database too.
+product_cache = TTLCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
+
+
+def get_product(db, identifier):
+    """Find a product by product_id, falling back to barcode, through the cache.
+
+    Returns the product document or None. Callers must not mutate it.
+    """
+    found, product = product_cache.lookup(identifier)
+    if found:
+        return product
+    product = db.products.find_one({'product_id': identifier})
+    if not product:
+        product = db.products.find_one({'barcode': identifier})
+    product_cache.set(identifier, product)
+    if product:
+        product_cache.set(product['product_id'], product)
+        if product.get('barcode'):
+            product_cache.set(product['barcode'], product)
+    return product
+
+
+def invalidate_product(*identifiers):
+    """Call after any write to a product (including stock changes), passing
+    every identifier that may be cached (product_id, barcode)."""
+    for identifier in identifiers:
+        if not identifier:
+            continue
+        product = product_cache.pop(identifier)
+        if product:
+            # The same document is also cached under its other identifier.
+            product_cache.pop(product['product_id'])
+            product_cache.pop(product.get('barcode'))
+
+
+# Customer display names keyed by (lookup field, value).
+user_name_cache = TTLCache(USER_NAME_CACHE_SIZE, USER_NAME_CACHE_TTL)
+
+
+def get_user_names(db, identifiers, field='user_id'):
+    """Resolve users' names for many identifiers with at most one $in query.
+
+    field is the users field the identifiers refer to ('user_id' or
+    'phone_number'). Returns {identifier: name}; unknown users map to None.
+    """
+    names, missing = _cached_user_names(identifiers, field)
+    if missing:
+        _store_user_names(names, missing, field, db.users.find({field: {'$in': missing}}, {field: 1, 'name': 1}))
+    return names
+
+
+async def get_user_names_async(db, identifiers, field='user_id'):
+    """get_user_names() for an asyncio (AsyncMongoClient) database."""
+    names, missing = _cached_user_names(identifiers, field)
+    if missing:
+        users = await db.users.find({field: {'$in': missing}}, {field: 1, 'name': 1}).to_list()
+        _store_user_names(names, missing, field, users)
+    return names
+
+
+def _cached_user_names(identifiers, field):
+    names = {}
+    missing = []
+    for identifier in set(identifiers):
+        found, name = user_name_cache.lookup((field, identifier))
+        if found:
+            names[identifier] = name
+        else:
+            missing.append(identifier)
+    return names, missing
+
+
+def _store_user_names(names, missing, field, users):
+    for identifier in missing:
+        names[identifier] = None
+    for user in users:
+        names[user[field]] = user.get('name')
+    for identifier in missing:
+        user_name_cache.set((field, identifier), names[identifier])
+
+
+# Last status response per pending Stripe session; while an entry is alive
+# polls for that session are answered without calling Stripe again.
+payment_status_cache = TTLCache(10000, STRIPE_POLL_MIN_INTERVAL)
+
+# Totals shown next to paginated admin listings
+count_cache = CountCache(1000, COUNT_CACHE_TTL)
+
+
+def cache_stats():
+    return {
+        'discounts': discount_index.stats(),
+        'discount_view': discount_view.stats(),
+        'products': product_cache.stats(),
+        'user_names': user_name_cache.stats(),
+        'payment_status': payment_status_cache.stats(),
+        'counts': count_cache.stats()
+    }
+
+
+def _reset_after_fork():
+    # A lock held by one of the parent's threads at fork time would never be
+    # released in the child, and recounts the parent had in flight do not
+    # exist here. Start the child with fresh locks and empty caches.
+    for cache in (discount_index, product_cache, user_name_cache, payment_status_cache, count_cache):
+        cache._lock = threading.Lock()
+    count_cache._refreshing = set()
+    count_cache._tasks = set()
+    discount_index.invalidate()
+    discount_view.invalidate()
+    product_cache.clear()
+    user_name_cache.clear()
+    payment_status_cache.clear()
+    count_cache.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,135 @@
+"""Cart document helpers.
+
+A cart stores its contents as a quantity map keyed by product_id:
+
+    {'cart_id': <phone_number>, 'items': {<product_id>: <quantity>, ...}}
+
+so every scan or removal is a single atomic update on one field instead of a
+read-modify-write of an ever-growing list.
+"""
+
+ITEMS_FIELD = 'items'
+# Legacy carts stored one product_id array element per unit. They are read
+# alongside the map until migrate_list_carts has converted them.
+LEGACY_FIELD = 'product_id'
+# Projection loading everything cart_quantities() reads
+CART_FIELDS = {ITEMS_FIELD: 1, LEGACY_FIELD: 1}
+
+
+def item_path(product_id):
+    """Dotted path of a product's quantity inside the cart document."""
+    product_id = str(product_id)
+    if not product_id or '.' in product_id or product_id.startswith('$'):
+        raise ValueError(f'Invalid product_id for cart: {product_id!r}')
+    return f'{ITEMS_FIELD}.{product_id}'
+
+
+def cart_quantities(cart):
+    """Return {product_id: quantity} for the lines of a cart with quantity > 0,
+    counting any units still held in the legacy product_id list."""
+    quantities = {}
+    if has_legacy_list(cart):
+        for product_id in cart[LEGACY_FIELD]:
+            quantities[str(product_id)] = quantities.get(str(product_id), 0) + 1
+    items = (cart or {}).get(ITEMS_FIELD) or {}
+    for product_id, qty in items.items():
+        if qty and qty > 0:
+            quantities[product_id] = quantities.get(product_id, 0) + qty
+    return quantities
+
+
+def increment_update(quantities):
+    """Update document adding each {product_id: qty} to the cart."""
+    return {'$inc': {item_path(product_id): qty for product_id, qty in quantities.items()}}
+
+
+def _quantity(product_id):
+    return {'$getField': {'field': {'$literal': str(product_id)}, 'input': f'${ITEMS_FIELD}'}}
+
+
+def _increment_stage(product_id, qty):
+    """Pipeline stage adding qty to one line, creating it if needed."""
+    return {'$set': {ITEMS_FIELD: {'$setField': {
+        'field': {'$literal': str(product_id)},
+        'input': {'$ifNull': [f'${ITEMS_FIELD}', {}]},
+        'value': {'$add': [{'$ifNull': [_quantity(product_id), 0]}, qty]}
+    }}}}
+
+
+def _decrement_stage(product_id, qty):
+    """Pipeline stage lowering one line by qty, removing it once it reaches zero."""
+    current = _quantity(product_id)
+    return {'$set': {ITEMS_FIELD: {'$cond': [
+        {'$gt': [current, qty]},
+        {'$setField': {
+            'field': {'$literal': str(product_id)},
+            'input': f'${ITEMS_FIELD}',
+            'value': {'$subtract': [current, qty]}
+        }},
+        {'$unsetField': {'field': {'$literal': str(product_id)}, 'input': f'${ITEMS_FIELD}'}}
+    ]}}}
+
+
+def decrement_update(quantities):
+    """Update pipeline removing {product_id: qty} from the cart in one write.
+
+    Lines that drop to zero are removed from the map rather than left at 0.
+    """
+    for product_id in quantities:
+        item_path(product_id)
+    return [_decrement_stage(product_id, qty) for product_id, qty in quantities.items()]
+
+
+def change_update(increments, decrements):
+    """Update pipeline applying several additions and removals in one write."""
+    for product_id in list(increments) + list(decrements):
+        item_path(product_id)
+    stages = [_increment_stage(product_id, qty) for product_id, qty in increments.items()]
+    stages += [_decrement_stage(product_id, qty) for product_id, qty in decrements.items()]
+    return stages
+
+
+def clear_update():
+    return {'$set': {ITEMS_FIELD: {}}, '$unset': {LEGACY_FIELD: ''}}
+
+
+# Converts a legacy product_id list into quantities, adding them to any units
+# already held in the map of a cart that has not been converted yet
+_LIST_TO_MAP = [
+    {'$set': {ITEMS_FIELD: {'$mergeObjects': [
+        {'$ifNull': [f'${ITEMS_FIELD}', {}]},
+        {'$arrayToObject': {'$map': {
+            'input': {'$setUnion': [f'${LEGACY_FIELD}', []]},
+            'as': 'pid',
+            'in': {
+                'k': {'$toString': '$$pid'},
+                'v': {'$add': [
+                    {'$size': {'$filter': {
+                        'input': f'${LEGACY_FIELD}',
+                        'cond': {'$eq': ['$$this', '$$pid']}
+                    }}},
+                    {'$ifNull': [{'$getField': {
+                        'field': {'$toString': '$$pid'},
+                        'input': {'$ifNull': [f'${ITEMS_FIELD}', {}]}
+                    }}, 0]}
+                ]}
+            }
+        }}}
+    ]}}},
+    {'$unset': LEGACY_FIELD}
+]
+
+
+def has_legacy_list(cart):
+    return isinstance((cart or {}).get(LEGACY_FIELD), list)
+
+
+def convert_list_cart(db, cart_id):
+    """Convert one legacy cart before a conditional write on its quantity map."""
+    db.cart_items.update_one({'cart_id': cart_id, LEGACY_FIELD: {'$type': 'array'}}, _LIST_TO_MAP)
+
+
+def migrate_list_carts(db):
+    """Convert legacy carts storing one product_id array element per unit into
+    the quantity map. Idempotent: only carts still holding an array match."""
+    db.cart_items.update_many({LEGACY_FIELD: {'$type': 'array'}}, _LIST_TO_MAP)
@@ -0,0 +1,255 @@
+"""Order placement pipeline used by /users/orders/place_order.
+
+The checkout runs as a fixed sequence of stages with a constant number of
+database operations however large the cart is:
+
+    1. cart        one find_one on cart_items
+    2. customer    cached name lookup (one find_one on a cache miss)
+    3. products    one find with $in over the cart's product ids
+    4. pricing     in-memory, against the active discount index
+    5. commit      order, order_items, payment, sales rollup and cart reset
+                   in one multi-document transaction (sequential on
+                   standalone)
+
+Per-stage timings are collected so debug builds can report where the time
+went. place_order_async runs the same stages on the asyncio driver for the
+ASGI serving mode.
+"""
+
+from datetime import datetime
+import asyncio
+import time
+
+from bson import ObjectId
+
+from async_db import run_in_transaction_async
+from cache import get_user_names, get_user_names_async
+from carts import CART_FIELDS, cart_quantities, clear_update
+from db import run_in_transaction
+from pricing import price_products, price_products_async
+from rollups import record_payment, record_payment_async
+
+
+class CheckoutError(Exception):
+    """A checkout that cannot proceed because of the request or cart state."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _payment_method_label(method):
+    # Normalize payment method label to desired display (Card/UPI)
+    if str(method).lower() == 'card':
+        return 'Card'
+    if str(method).lower() == 'upi':
+        return 'UPI'
+    return str(method)
+
+
+def _order_lines(priced_items):
+    """Turn priced items into order lines and the order totals."""
+    products = []
+    total_order_amount = 0
+    total_original_amount = 0
+    for item in priced_items:
+        product = item['product']
+        total_order_amount += item['line_total']
+        total_original_amount += item['original_total']
+        products.append({
+            'product_id': product['product_id'],
+            'name': product['name'],
+            'price': product['price'],
+            'discount_price': round(item['discount_price'], 2),
+            'discount_percentage': item['discount_percentage'],
+            'discount_name': item['discount_name'],
+            'quantity': item['quantity'],
+            'item_total': round(item['line_total'], 2),
+            'original_total': round(item['original_total'], 2)
+        })
+    return products, total_order_amount, total_original_amount
+
+
+def _stage_timer():
+    """(timings, mark): mark(stage) records the milliseconds since the
+    previous mark under stage."""
+    timings = {}
+    stage_started = time.perf_counter()
+
+    def mark(stage):
+        nonlocal stage_started
+        now = time.perf_counter()
+        timings[stage] = round((now - stage_started) * 1000, 2)
+        stage_started = now
+
+    return timings, mark
+
+
+def build_order(phone_number, payment_method, billing_address, customer_name, priced_items):
+    """Build every document a checkout writes, plus the client response.
+
+    Returns (order_data, order_items, payment_data, result). The order _id is
+    generated client side so items and payment can reference it without
+    waiting for the insert.
+    """
+    products, total_order_amount, total_original_amount = _order_lines(priced_items)
+
+    current_datetime = datetime.now()
+    method_display = _payment_method_label(payment_method)
+    order_oid = ObjectId()
+    order_id = str(order_oid)
+    amount_paise = int(round(total_order_amount * 100))
+
+    order_data = {
+        '_id': order_oid,
+        'user_id': phone_number,
+        'customer_name': customer_name,
+        'order_date': current_datetime,
+        'order_date_string': current_datetime.strftime('%Y-%m-%d %H:%M:%S'),
+        'order_timestamp': current_datetime.timestamp(),
+        'products': products,
+        'total_amount': round(total_order_amount, 2),
+        'original_total_amount': round(total_original_amount, 2),
+        'total_savings': round(total_original_amount - total_order_amount, 2),
+        'payment_method': method_display,
+        'billing_address': billing_address or '',
+        'order_status': 'Completed',
+        'payment_status': 'Completed',
+        'delivery_status': 'Done',
+        'created_at': current_datetime,
+        'updated_at': current_datetime
+    }
+
+    order_items = [{
+        'order_id': order_id,
+        'product_id': product['product_id'],
+        'product_name': product['name'],
+        'quantity': product['quantity'],
+        'unit_price': product['discount_price'],
+        'total_price': product['item_total'],
+        'original_unit_price': product['price'],
+        'original_total_price': product['original_total'],
+        'discount_percentage': product['discount_percentage'],
+        'discount_name': product['discount_name'],
+        'created_at': current_datetime
+    } for product in products]
+
+    # Payment record stores the amount in paise
+    payment_data = {
+        'order_id': order_id,
+        'user_id': phone_number,
+        'amount': amount_paise,
+        'payment_method': method_display,
+        'payment_status': 'Completed',
+        'transaction_id': f"TXN_{int(current_datetime.timestamp())}_{phone_number}",
+        'created_at': current_datetime,
+        'updated_at': current_datetime
+    }
+
+    result = {
+        'message': 'Order placed successfully',
+        'order_id': order_id,
+        'order_date': current_datetime.strftime('%Y-%m-%d %H:%M:%S'),
+        'total_amount': total_order_amount,
+        'total_amount_paise': amount_paise,
+        'total_savings': round(total_original_amount - total_order_amount, 2)
+    }
+    return order_data, order_items, payment_data, result
+
+
+def place_order(db, phone_number, payment_method, billing_address):
+    """Run the checkout for a user's cart.
+
+    Returns (result, timings): result is the response payload for the client,
+    timings maps stage name -> milliseconds. Raises CheckoutError when the
+    order cannot be placed.
+    """
+    timings, mark = _stage_timer()
+
+    cart = db.cart_items.find_one({'cart_id': phone_number}, CART_FIELDS)
+    product_counts = cart_quantities(cart)
+    if not product_counts:
+        raise CheckoutError('Cart is empty')
+    mark('cart')
+
+    customer_name = get_user_names(db, [phone_number], field='phone_number').get(phone_number) or 'Unknown Customer'
+    mark('customer')
+
+    product_details = list(db.products.find({'product_id': {'$in': list(product_counts)}}))
+    mark('products')
+
+    priced_items = price_products(db, product_details, product_counts)
+    mark('pricing')
+
+    order_data, order_items, payment_data, result = build_order(
+        phone_number, payment_method, billing_address, customer_name, priced_items
+    )
+    mark('build')
+
+    def commit(session):
+        db.orders.insert_one(order_data, session=session)
+        if order_items:
+            db.order_items.insert_many(order_items, session=session)
+        db.payments.insert_one(payment_data, session=session)
+        record_payment(db, payment_data, session=session)
+        # Clear the user's cart after successful order placement
+        db.cart_items.update_one({'cart_id': phone_number}, clear_update(), session=session)
+
+    run_in_transaction(commit)
+    mark('commit')
+    return result, timings
+
+
+async def place_order_async(db, phone_number, payment_method, billing_address):
+    """place_order() on an asyncio (AsyncMongoClient) database.
+
+    The cart and the customer name are read concurrently, and without a
+    transaction (standalone server) the order, items and payment inserts are
+    sent concurrently too; inside a transaction they share one session and
+    stay sequential. The rollup and the cart are written after them.
+    """
+    timings, mark = _stage_timer()
+
+    cart, names = await asyncio.gather(
+        db.cart_items.find_one({'cart_id': phone_number}, CART_FIELDS),
+        get_user_names_async(db, [phone_number], field='phone_number')
+    )
+    product_counts = cart_quantities(cart)
+    if not product_counts:
+        raise CheckoutError('Cart is empty')
+    customer_name = names.get(phone_number) or 'Unknown Customer'
+    mark('cart')
+
+    product_details = await db.products.find({'product_id': {'$in': list(product_counts)}}).to_list()
+    mark('products')
+
+    priced_items = await price_products_async(db, product_details, product_counts)
+    mark('pricing')
+
+    order_data, order_items, payment_data, result = build_order(
+        phone_number, payment_method, billing_address, customer_name, priced_items
+    )
+    mark('build')
+
+    async def commit(session):
+        if session is None:
+            inserts = [db.orders.insert_one(order_data)]
+            if order_items:
+                inserts.append(db.order_items.insert_many(order_items))
+            inserts.append(db.payments.insert_one(payment_data))
+            await asyncio.gather(*inserts)
+        else:
+            # One session serves one operation at a time
+            await db.orders.insert_one(order_data, session=session)
+            if order_items:
+                await db.order_items.insert_many(order_items, session=session)
+            await db.payments.insert_one(payment_data, session=session)
+        # The rollup counts a payment that now exists, and the cart is only
+        # cleared once the order has been written
+        await record_payment_async(db, payment_data, session=session)
+        await db.cart_items.update_one({'cart_id': phone_number}, clear_update(), session=session)
+
+    await run_in_transaction_async(commit)
+    mark('commit')
+    return result, timings
@@ -0,0 +1,44 @@
+"""Conditional GET (If-None-Match / ETag) support for read endpoints.
+
+Decorate a view with @conditional(validator) where validator(*view_args)
+cheaply returns the current ETag, typically from versions.get_version(). A
+request whose If-None-Match matches is answered with 304 before the view runs,
+so neither the query nor the serialization happens.
+
+Without a validator, or when it returns None, the view runs and the ETag is a
+hash of the response body. That still saves the transfer of an unchanged
+payload.
+"""
+
+from functools import wraps
+
+from flask import current_app, request
+
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def conditional(validator=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = validator(*args, **kwargs) if validator else None
+            if etag is not None and request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if etag is not None:
+                response.set_etag(etag, weak=True)
+            elif 'ETag' not in response.headers:
+                # Views may set their own content-derived ETag
+                response.add_etag(weak=True)
+            # Let clients keep the payload but revalidate it on every use
+            response.headers.setdefault('Cache-Control', 'no-cache')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
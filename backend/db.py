@@ -1,13 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app, g
 from pymongo import MongoClient
+from pymongo.topology_description import TOPOLOGY_TYPE
 from dotenv import load_dotenv
+import atexit
 import os
+import threading
 
 load_dotenv()
 
-# You can set your MongoDB URI here or load from config
+DB_NAME = os.getenv('MONGO_DB_NAME', 'database')
+
+# One MongoClient per process. The client owns the connection pool and the
+# server monitoring threads, so it must be shared across requests instead of
+# being rebuilt (and leaked) on every call to get_db().
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Thread pools for sending independent queries concurrently, by name
+_executors = {}
+
+
+def _pool_options():
+    """Connection pool settings, tunable through environment variables."""
+    return {
+        'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+        'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+        'waitQueueTimeoutMS': int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+        'maxIdleTimeMS': int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000)),
+    }
+
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use.
+
+    The owning pid is remembered so that a client inherited through fork()
+    (e.g. by pre-forking server workers) is never reused in the child.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                # connect=False defers socket creation until the first
+                # operation, which keeps creating the client fork-safe.
+                _client = MongoClient(os.getenv('MONGO_URI'), connect=False, **_pool_options())
+                _client_pid = pid
+    return _client
+
+
+def close_client():
+    """Close the pooled client (sockets and monitor threads) if one is open."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_executor(name, max_workers):
+    """Return this process's thread pool called name, creating it on first use.
+
+    Pools are never created at import time: under a pre-forking server the
+    child would inherit the executor but not its threads.
+    """
+    executor = _executors.get(name)
+    if executor is None:
+        with _client_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+                _executors[name] = executor
+    return executor
+
+
+def _reset_after_fork():
+    # The parent's client and lock state are not valid in the child. Drop the
+    # reference without closing it (that would touch the parent's sockets)
+    # and start with a fresh lock in case another thread held it at fork time.
+    # The parent's pools have no threads here, so they are dropped as well.
+    global _client, _client_pid, _client_lock, _executors
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+    _executors = {}
+
+# Thread pools for sending independent queries concurrently, by name
+_executors = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+atexit.register(close_client)
+
+
+def supports_transactions(client=None):
+    """Multi-document transactions need a replica set or sharded cluster."""
+    client = client or get_client()
+    return client.topology_description.topology_type in (
+        TOPOLOGY_TYPE.ReplicaSetWithPrimary,
+        TOPOLOGY_TYPE.Sharded,
+        TOPOLOGY_TYPE.LoadBalanced,
+    )
+
+
+def supports_client_bulk_write(client=None):
+    """MongoClient.bulk_write, with per-operation results, needs MongoDB 8.0
+    (wire version 25) on every server it may write to."""
+    client = client or get_client()
+    versions = [server.max_wire_version for server in client.topology_description.server_descriptions().values()
+                if server.is_writable]
+    return bool(versions) and min(versions) >= 25
+
+
+def run_in_transaction(callback):
+    """Run callback(session) inside a multi-document transaction.
+
+    On a standalone server (typical local development) transactions are not
+    available and callback(None) runs the operations without one.
+    """
+    client = get_client()
+    if not supports_transactions(client):
+        return callback(None)
+    with client.start_session() as session:
+        return session.with_transaction(callback)
+
+
+def get_database():
+    """Database handle for code running outside a request (threads, CLI)."""
+    return get_client()[DB_NAME]
+
+
 def get_db():
     if 'db' not in g:
-        client = MongoClient(os.getenv('MONGO_URI'))
-        g.db = client['database']
-    return g.db
\ No newline at end of file
+        g.db = get_database()
+    return g.db
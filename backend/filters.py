@@ -0,0 +1,112 @@
+"""Status and date filters shared by the admin payments endpoints.
+
+The transactions list, the summary and both revenue charts accept the same
+query parameters:
+
+    status  'All', a status ('Completed', 'Pending', 'Failed') or an alias
+            such as 'paid' or 'success'
+    date    'All', 'Today', 'This Month', 'YYYY-MM' or 'YYYY-MM-DD'
+
+compile_payment_filter turns them into an equality/$in on payment_status and
+a half-open range on created_at, plus the name of the index that serves that
+shape, so all four endpoints select the same payments. compile_rollup_filter
+builds the same predicate over sales_daily for the charts.
+"""
+
+from datetime import datetime, timedelta
+
+from payments import COMPLETED, FAILED, PENDING
+
+# Stored payment_status values per status, including legacy spellings
+STATUS_VALUES = {
+    COMPLETED: ('Completed', 'completed', 'Paid', 'paid', 'Success', 'success'),
+    PENDING: ('Pending', 'pending'),
+    FAILED: ('Failed', 'failed'),
+}
+
+STATUS_ALIASES = {
+    'completed': COMPLETED,
+    'paid': COMPLETED,
+    'success': COMPLETED,
+    'succeeded': COMPLETED,
+    'pending': PENDING,
+    'unpaid': PENDING,
+    'failed': FAILED,
+    'expired': FAILED,
+}
+
+# Indexes created by migrations.INDEXES for these filters
+PAYMENTS_STATUS_DATE_INDEX = 'payment_status_1_created_at_-1__id_-1'
+PAYMENTS_DATE_INDEX = 'created_at_-1__id_-1'
+ROLLUP_INDEX = 'day_1_status_1_method_1'
+
+
+def _next_month(year, month):
+    return datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+
+
+def date_range(date_filter, now=None):
+    """{'$gte', '$lt'} bounds for a date filter, or None for 'All'.
+
+    Raises ValueError for anything that is not one of the accepted forms.
+    """
+    if not date_filter or date_filter == 'All':
+        return None
+    now = now or datetime.now()
+    if date_filter == 'Today':
+        start = datetime(now.year, now.month, now.day)
+        return {'$gte': start, '$lt': start + timedelta(days=1)}
+    if date_filter == 'This Month':
+        return {'$gte': datetime(now.year, now.month, 1), '$lt': _next_month(now.year, now.month)}
+    try:
+        if len(date_filter) == 10:
+            start = datetime.strptime(date_filter, '%Y-%m-%d')
+            return {'$gte': start, '$lt': start + timedelta(days=1)}
+        if len(date_filter) == 7:
+            start = datetime.strptime(date_filter, '%Y-%m')
+            return {'$gte': start, '$lt': _next_month(start.year, start.month)}
+    except ValueError:
+        pass
+    raise ValueError(f'Invalid date filter: {date_filter}')
+
+
+def status_predicate(status_filter):
+    """Match for payment_status, or None for 'All'."""
+    if not status_filter or status_filter == 'All':
+        return None
+    status = STATUS_ALIASES.get(status_filter.lower(), status_filter)
+    values = STATUS_VALUES.get(status)
+    if values is None:
+        return status_filter
+    return {'$in': list(values)}
+
+
+def _compile(status_filter, date_filter, status_field, date_field):
+    query = {}
+    status = status_predicate(status_filter)
+    if status is not None:
+        query[status_field] = status
+    dates = date_range(date_filter)
+    if dates is not None:
+        query[date_field] = dates
+    return query
+
+
+def compile_payment_filter(status_filter='All', date_filter='All'):
+    """(query, hint) over payments for the status and date parameters.
+
+    hint is None when nothing is filtered; the planner then picks the index
+    that matches the caller's sort, if any.
+    """
+    query = _compile(status_filter, date_filter, 'payment_status', 'created_at')
+    if not query:
+        return query, None
+    if 'payment_status' in query:
+        return query, PAYMENTS_STATUS_DATE_INDEX
+    return query, PAYMENTS_DATE_INDEX
+
+
+def compile_rollup_filter(status_filter='All', date_filter='All'):
+    """(query, hint) selecting the same payments' buckets in sales_daily."""
+    query = _compile(status_filter, date_filter, 'status', 'day')
+    return query, ROLLUP_INDEX if 'day' in query else None
@@ -0,0 +1,43 @@
+"""Gunicorn settings for serving the API in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be tuned through the environment. The default gthread
+workers pair well with pymongo's thread-safe pool: each worker process has
+one MongoClient shared by its threads (MONGO_MAX_POOL_SIZE connections).
+Send SIGHUP to replace the workers gracefully; with GUNICORN_PRELOAD=1 code
+changes need a full restart, since the workers are forked from the master.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+# Seconds in-flight requests get to finish on reload or shutdown
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers after this many requests (0 disables)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+# Build the app (and run migrations) once in the master instead of per worker
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork(); the reconciler's Mongo lease keeps it
+    # running in only one worker at a time.
+    from reconciler import start_reconciler
+    start_reconciler()
+
+
+def worker_exit(server, worker):
+    from db import close_client
+    from reconciler import reconciler
+    reconciler.stop()
+    close_client()
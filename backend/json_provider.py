@@ -0,0 +1,66 @@
+"""Flask JSON provider that encodes Mongo documents directly.
+
+Handlers can pass query results straight to jsonify(): ObjectId becomes its
+hex string and datetimes use DATETIME_FORMAT, in the same single encoding
+pass. orjson is used when it is installed, otherwise the standard library
+encoder with the same conversions.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import json
+
+from bson import Decimal128, ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def encode_default(obj):
+    """Conversions for types neither encoder handles the way the API wants."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.strftime(DATETIME_FORMAT)
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal128):
+        obj = obj.to_decimal()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    # Datetimes are passed through to encode_default so both encoders emit
+    # the same format; keys are sorted like Flask's default provider.
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    default = staticmethod(encode_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            options = _ORJSON_OPTIONS
+            if kwargs.get('indent'):
+                options |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=encode_default, option=options).decode('utf-8')
+            except TypeError:
+                # e.g. integers beyond 64 bits; the stdlib encoder handles those
+                pass
+        kwargs.setdefault('default', encode_default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
@@ -0,0 +1,239 @@
+"""Index declarations and versioned schema migrations.
+
+Run automatically at startup (see app.py) or by hand with:
+
+    flask --app app db migrate
+    flask --app app db drift
+    flask --app app db rollup-sales
+    flask --app app db normalize-timestamps
+"""
+
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from db import get_db
+from carts import migrate_list_carts
+from rollups import SALES_DAILY, rebuild_sales_daily
+from timestamps import migrate_timestamps, normalize_timestamps, reset_progress
+
+# Indexes backing the filters used by the request handlers, per collection.
+# Index names are given explicitly so drift detection can compare by name.
+INDEXES = {
+    'products': [
+        # Unique: every stock update and cart line addresses one product.
+        IndexModel([('product_id', ASCENDING)], name='product_id_1', unique=True),
+        IndexModel([('barcode', ASCENDING)], name='barcode_1', unique=True, sparse=True),
+        # view_discounts joins discounts to products on barcode, product_id and discount_id
+        IndexModel([('discount_id', ASCENDING)], name='discount_id_1'),
+        # Admin catalog listing keyset order
+        IndexModel([('name', ASCENDING), ('_id', ASCENDING)], name='name_1__id_1'),
+    ],
+    'discounts': [
+        IndexModel([('product_barcode', ASCENDING), ('status', ASCENDING)], name='product_barcode_1_status_1'),
+        IndexModel([('status', ASCENDING), ('end_date', ASCENDING)], name='status_1_end_date_1'),
+    ],
+    'cart_items': [
+        IndexModel([('cart_id', ASCENDING)], name='cart_id_1'),
+    ],
+    'users': [
+        # Admin accounts have no phone number, hence sparse.
+        IndexModel([('phone_number', ASCENDING)], name='phone_number_1', unique=True, sparse=True),
+        IndexModel([('user_id', ASCENDING)], name='user_id_1'),
+    ],
+    'orders': [
+        IndexModel([('user_id', ASCENDING), ('order_date', DESCENDING)], name='user_id_1_order_date_-1'),
+        # Admin orders listing: keyset order, optionally after a payment_status filter
+        IndexModel([('order_date', DESCENDING), ('_id', DESCENDING)], name='order_date_-1__id_-1'),
+        IndexModel([('payment_status', ASCENDING), ('order_date', DESCENDING), ('_id', DESCENDING)],
+                   name='payment_status_1_order_date_-1__id_-1'),
+    ],
+    'order_items': [
+        IndexModel([('order_id', ASCENDING)], name='order_id_1'),
+    ],
+    'payments': [
+        IndexModel([('session_id', ASCENDING)], name='session_id_1', sparse=True),
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)], name='user_id_1_created_at_-1'),
+        # Transactions listing keyset order; also serves created_at range filters
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='created_at_-1__id_-1'),
+        # Same listing and ranges filtered by status (filters.compile_payment_filter)
+        IndexModel([('payment_status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='payment_status_1_created_at_-1__id_-1'),
+        # Reconciler scan for stale pending sessions
+        IndexModel([('payment_status', ASCENDING), ('updated_at', ASCENDING)], name='payment_status_1_updated_at_1'),
+    ],
+    'transactions': [
+        IndexModel([('transaction_id', ASCENDING)], name='transaction_id_1'),
+    ],
+    SALES_DAILY: [
+        # One row per bucket; concurrent upserts of a new bucket rely on it.
+        IndexModel([('day', ASCENDING), ('status', ASCENDING), ('method', ASCENDING)],
+                   name='day_1_status_1_method_1', unique=True),
+    ],
+}
+
+# Index options that are part of an index's identity for drift purposes.
+_COMPARED_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds')
+
+MIGRATIONS_COLLECTION = 'schema_migrations'
+
+
+def ensure_indexes(db):
+    """Create every declared index. Safe to call repeatedly.
+
+    Returns a dict of collection name -> list of "<index>: <error>" entries
+    for indexes that could not be built (e.g. a unique index over existing
+    duplicate values).
+    """
+    failures = {}
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                db[collection].create_indexes([model])
+            except OperationFailure as e:
+                failures.setdefault(collection, []).append(f"{model.document['name']}: {e}")
+    return failures
+
+
+def index_drift(db):
+    """Compare declared indexes against the live ones.
+
+    Returns a list of human readable drift entries; empty means in sync.
+    """
+    drift = []
+    for collection, models in INDEXES.items():
+        existing = db[collection].index_information()
+        declared_names = set()
+        for model in models:
+            spec = model.document
+            name = spec['name']
+            declared_names.add(name)
+            live = existing.get(name)
+            if live is None:
+                drift.append(f'{collection}.{name}: missing')
+                continue
+            if list(live['key']) != list(spec['key'].items()):
+                drift.append(f"{collection}.{name}: key is {live['key']}, expected {list(spec['key'].items())}")
+            for option in _COMPARED_OPTIONS:
+                if live.get(option) != spec.get(option):
+                    drift.append(f'{collection}.{name}: {option} is {live.get(option)}, expected {spec.get(option)}')
+        for name in existing:
+            if name != '_id_' and name not in declared_names:
+                drift.append(f'{collection}.{name}: not declared')
+    return drift
+
+
+def _build_indexes(db):
+    failures = ensure_indexes(db)
+    if failures:
+        raise RuntimeError(f'Index build failed: {failures}')
+
+
+def _drop_payments_created_at_index(db):
+    # Superseded by created_at_-1__id_-1, which covers the same filters.
+    if 'created_at_-1' in db.payments.index_information():
+        db.payments.drop_index('created_at_-1')
+    _build_indexes(db)
+
+
+def _make_product_id_unique(db):
+    # Index options cannot be changed in place; rebuild it as unique.
+    live = db.products.index_information().get('product_id_1')
+    if live and not live.get('unique'):
+        db.products.drop_index('product_id_1')
+    _build_indexes(db)
+
+
+# Ordered list of (version, description, function). Append new entries with
+# the next version number; never edit or reorder applied ones. Migrations must
+# be idempotent since several workers may start at the same time.
+MIGRATIONS = [
+    (1, 'Create initial query indexes', _build_indexes),
+    (2, 'Convert cart product_id lists to quantity maps', migrate_list_carts),
+    (3, 'Make products.product_id unique', _make_product_id_unique),
+    (4, 'Backfill sales_daily from payments', rebuild_sales_daily),
+    (5, 'Replace payments.created_at index with created_at + _id', _drop_payments_created_at_index),
+    (6, 'Convert string timestamps to dates and require dates on write', migrate_timestamps),
+    # The rebuild skips payments whose created_at is still a string
+    (7, 'Rebuild sales_daily from converted timestamps', rebuild_sales_daily),
+]
+
+
+def applied_versions(db):
+    return {m['_id'] for m in db[MIGRATIONS_COLLECTION].find({}, {'_id': 1})}
+
+
+def run_migrations(db):
+    """Apply pending migrations in order, then make sure all indexes exist.
+
+    Returns the list of versions applied by this call.
+    """
+    done = applied_versions(db)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        migrate(db)
+        try:
+            db[MIGRATIONS_COLLECTION].insert_one({
+                '_id': version,
+                'description': description,
+                'applied_at': datetime.now()
+            })
+        except DuplicateKeyError:
+            # Another worker applied it concurrently; migrations are idempotent.
+            continue
+        applied.append(version)
+    # Indexes declared after the last migration still get built here.
+    ensure_indexes(db)
+    return applied
+
+
+db_cli = AppGroup('db', help='Database index and migration commands.')
+
+
+@db_cli.command('migrate')
+def migrate_command():
+    """Apply pending migrations and build declared indexes."""
+    applied = run_migrations(get_db())
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        click.echo('Database is up to date.')
+
+
+@db_cli.command('drift')
+def drift_command():
+    """Report differences between declared and live indexes."""
+    db = get_db()
+    pending = [v for v, _, _ in MIGRATIONS if v not in applied_versions(db)]
+    if pending:
+        click.echo(f"Pending migrations: {', '.join(str(v) for v in pending)}")
+    drift = index_drift(db)
+    for entry in drift:
+        click.echo(entry)
+    if not drift and not pending:
+        click.echo('No drift.')
+
+
+@db_cli.command('rollup-sales')
+def rollup_sales_command():
+    """Rebuild the sales_daily rollup from the payments history."""
+    db = get_db()
+    rebuild_sales_daily(db)
+    click.echo(f'Rebuilt {SALES_DAILY}: {db[SALES_DAILY].estimated_document_count()} rows.')
+
+
+@db_cli.command('normalize-timestamps')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--restart', is_flag=True, help='Rescan from the beginning instead of the saved position.')
+def normalize_timestamps_command(batch_size, restart):
+    """Convert legacy string timestamps to dates (resumable)."""
+    db = get_db()
+    if restart:
+        reset_progress(db)
+    for collection, (converted, unparseable) in normalize_timestamps(db, batch_size).items():
+        click.echo(f'{collection}: converted {converted}, unparseable {unparseable}')
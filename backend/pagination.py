@@ -0,0 +1,107 @@
+"""Keyset (cursor) pagination for admin listings.
+
+Instead of skip/limit, each page seeks past the sort key of the last row the
+client saw, so page N costs an index seek plus `limit` documents however deep
+it is. The sort must end in a unique field (normally _id) and be backed by an
+index in the same order.
+
+Cursors are opaque URL-safe tokens holding the direction and the boundary
+row's sort key values.
+"""
+
+import base64
+
+from bson import json_util
+
+NEXT = 'next'
+PREV = 'prev'
+
+
+def encode_cursor(direction, values):
+    payload = json_util.dumps({'d': direction, 'k': values})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (direction, values); raises ValueError for a malformed token."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        direction, values = payload['d'], payload['k']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+    if direction not in (NEXT, PREV) or not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return direction, values
+
+
+def _seek(sort, values, direction):
+    """Filter selecting rows strictly after the key values in sort order
+    (strictly before them when paging backwards)."""
+    clauses = []
+    for i, (field, order) in enumerate(sort):
+        forward = (order == -1) == (direction == NEXT)
+        clause = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        clause[field] = {'$lt' if forward else '$gt': values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def _page_find(query, sort, cursor):
+    """(direction, find_query, find_sort) for the page a cursor points at."""
+    direction, values = decode_cursor(cursor) if cursor else (None, None)
+    if values is not None and len(values) != len(sort):
+        raise ValueError('Invalid cursor')
+
+    find_query = query
+    find_sort = sort
+    if values is not None:
+        seek = _seek(sort, values, direction)
+        find_query = {'$and': [query, seek]} if query else seek
+    if direction == PREV:
+        find_sort = [(field, -order) for field, order in sort]
+    return direction, find_query, find_sort
+
+
+def _page_result(rows, sort, limit, direction):
+    """Trim the limit + 1 fetched rows to a page and build its cursors."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == PREV:
+        rows.reverse()
+
+    if direction == PREV:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, direction == NEXT
+
+    def key(row):
+        return [row.get(field) for field, _ in sort]
+
+    next_cursor = encode_cursor(NEXT, key(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_cursor(PREV, key(rows[0])) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+
+def keyset_page(collection, query, sort, limit, cursor=None, projection=None, hint=None):
+    """Fetch one page of collection.find(query) in sort order.
+
+    sort is a list of (field, 1 or -1) pairs ending in a unique field.
+    Returns (rows, next_cursor, prev_cursor); a cursor is None when there is
+    no page in that direction. hint names the index to use, e.g. one whose
+    key order matches sort.
+    """
+    direction, find_query, find_sort = _page_find(query, sort, cursor)
+    found = collection.find(find_query, projection).sort(find_sort).limit(limit + 1)
+    if hint:
+        found = found.hint(hint)
+    return _page_result(list(found), sort, limit, direction)
+
+
+async def keyset_page_async(collection, query, sort, limit, cursor=None, projection=None, hint=None):
+    """keyset_page() for an asyncio (AsyncMongoClient) collection."""
+    direction, find_query, find_sort = _page_find(query, sort, cursor)
+    found = collection.find(find_query, projection).sort(find_sort).limit(limit + 1)
+    if hint:
+        found = found.hint(hint)
+    return _page_result(await found.to_list(), sort, limit, direction)
@@ -0,0 +1,191 @@
+"""Payment status bookkeeping shared by the Stripe webhook, the payment
+status endpoint and the background reconciler.
+
+Local payments rows mirror the Stripe Checkout Session they were created for,
+so once Stripe pushes its events the status endpoint can answer from Mongo.
+"""
+
+from datetime import datetime
+import asyncio
+
+import rollups
+
+COMPLETED = 'Completed'
+PENDING = 'Pending'
+FAILED = 'Failed'
+
+# States Stripe will not change any more; polls for these never reach Stripe
+TERMINAL_STATUSES = (COMPLETED, FAILED)
+
+# Checkout Session events that change a payment's state. checkout.session.completed
+# can still be unpaid for asynchronous methods such as UPI; the outcome then
+# arrives with one of the async_payment events.
+SESSION_EVENTS = {
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+    'checkout.session.async_payment_failed',
+    'checkout.session.expired',
+}
+
+
+def _get(obj, key, default=None):
+    """Read a field from a Stripe object or a plain dict."""
+    if obj is None:
+        return default
+    try:
+        value = obj[key]
+    except (KeyError, TypeError):
+        return default
+    return default if value is None else value
+
+
+def _plain(obj):
+    # Newer stripe-python StripeObjects are not dicts; to_dict() converts them
+    return obj.to_dict() if hasattr(obj, 'to_dict') else dict(obj)
+
+
+def session_state(session, payment_intent_status=None, event_type=None):
+    """Derive the local payment state from a Stripe Checkout Session.
+
+    payment_intent_status is the status of the session's PaymentIntent when it
+    was fetched; event_type is the webhook event the session came with.
+    """
+    stripe_payment_status = _get(session, 'payment_status')
+    if (stripe_payment_status in ('paid', 'no_payment_required')
+            or payment_intent_status in ('succeeded', 'requires_capture')
+            or event_type == 'checkout.session.async_payment_succeeded'):
+        payment_status = COMPLETED
+    elif event_type in ('checkout.session.async_payment_failed', 'checkout.session.expired') \
+            or _get(session, 'status') == 'expired':
+        payment_status = FAILED
+    else:
+        payment_status = PENDING
+
+    customer_details = _get(session, 'customer_details')
+    metadata = _get(session, 'metadata')
+    return {
+        'payment_status': payment_status,
+        'stripe_payment_status': stripe_payment_status,
+        'stripe_payment_intent_status': payment_intent_status,
+        'amount_total': _get(session, 'amount_total'),
+        'currency': _get(session, 'currency'),
+        'customer_email': _get(customer_details, 'email'),
+        'metadata': _plain(metadata) if metadata else None,
+    }
+
+
+def payment_state_updates(payment_record, state, now=None):
+    """Work out the writes that bring a payment row in line with a session state.
+
+    A Completed or Failed payment is never moved back to Pending, so late or
+    redelivered webhook events cannot undo a final state. Returns
+    (new_status, updates) where updates is None when nothing differs from the
+    stored row, else a dict with the 'payment' and 'transaction' (filter,
+    update) pairs plus the 'rollup' pairs moving the payment between
+    sales_daily buckets. The payment filter includes the status that was read,
+    so of two concurrent writers only one sees its update match.
+    """
+    now = now or datetime.now()
+    old_status = payment_record.get('payment_status')
+    new_status = state['payment_status']
+    if old_status in TERMINAL_STATUSES and new_status == PENDING:
+        new_status = old_status
+    payment_completed = new_status == COMPLETED
+    session_id = payment_record['session_id']
+
+    payment_update = {
+        'payment_status': new_status,
+        'updated_at': now,
+        'stripe_payment_status': state['stripe_payment_status'],
+        'stripe_payment_intent_status': state['stripe_payment_intent_status'],
+    }
+    # Keep the session details needed to answer status polls locally
+    for field in ('amount_total', 'currency', 'customer_email', 'metadata'):
+        if state.get(field) is not None:
+            payment_update[f'stripe_{field}'] = state[field]
+
+    if all(payment_record.get(field) == value for field, value in payment_update.items() if field != 'updated_at'):
+        return new_status, None
+
+    payment_id = str(payment_record['_id'])
+    return new_status, {
+        'payment': (
+            {'session_id': session_id, 'payment_status': old_status},
+            {'$set': payment_update}
+        ),
+        'rollup': rollups.status_change_updates(payment_record, old_status, new_status),
+        'transaction': (
+            {'$or': [
+                {'transaction_id': payment_id},
+                {'order_id': payment_id}
+            ]},
+            {'$set': {
+                'payment_status': new_status,
+                'updated_at': now,
+                'transaction_date': now if payment_completed else payment_record.get('created_at', now),
+                'gateway_response.response_code': '200' if payment_completed else ('402' if new_status == FAILED else '102'),
+                'gateway_response.response_message': 'Payment successful' if payment_completed else ('Payment failed' if new_status == FAILED else 'Payment pending'),
+                'gateway_response.gateway_transaction_id': session_id
+            }}
+        )
+    }
+
+
+def apply_payment_state(db, payment_record, state, now=None):
+    """Write a session state to the payment row and its transaction row.
+
+    Both writes are skipped when nothing differs from the stored row, and when
+    another writer changed the payment's status first. Returns the resulting
+    status.
+    """
+    new_status, updates = payment_state_updates(payment_record, state, now)
+    if updates and db.payments.update_one(*updates['payment']).matched_count:
+        db.transactions.update_one(*updates['transaction'])
+        rollups.move_payment(db, payment_record, payment_record.get('payment_status'), new_status)
+    return new_status
+
+
+async def apply_payment_state_async(db, payment_record, state, now=None):
+    """apply_payment_state() for an asyncio (AsyncMongoClient) database. The
+    transaction and rollup writes do not depend on each other and are sent
+    together."""
+    new_status, updates = payment_state_updates(payment_record, state, now)
+    if updates and (await db.payments.update_one(*updates['payment'])).matched_count:
+        await asyncio.gather(
+            db.transactions.update_one(*updates['transaction']),
+            rollups.move_payment_async(db, payment_record, payment_record.get('payment_status'), new_status)
+        )
+    return new_status
+
+
+def session_status_response(session_id, state):
+    """Build the /users/payment-status payload from a state fetched from Stripe."""
+    return {
+        'session_id': session_id,
+        'checkout_payment_status': state['stripe_payment_status'],
+        'payment_intent_status': state['stripe_payment_intent_status'],
+        'payment_completed': state['payment_status'] == COMPLETED,
+        'amount_total': state['amount_total'],
+        'currency': state['currency'],
+        'customer_email': state['customer_email'],
+        'metadata': state['metadata']
+    }
+
+
+def local_status_response(payment_record):
+    """Build the /users/payment-status payload from a payments row alone."""
+    metadata = payment_record.get('stripe_metadata') or {
+        'user_id': payment_record.get('user_id'),
+        'order_id': payment_record.get('order_id'),
+        'platform': 'smartmart'
+    }
+    return {
+        'session_id': payment_record['session_id'],
+        'checkout_payment_status': payment_record.get('stripe_payment_status'),
+        'payment_intent_status': payment_record.get('stripe_payment_intent_status'),
+        'payment_completed': payment_record.get('payment_status') == COMPLETED,
+        'amount_total': payment_record.get('stripe_amount_total', payment_record.get('amount')),
+        'currency': payment_record.get('stripe_currency', str(payment_record.get('currency', 'inr')).lower()),
+        'customer_email': payment_record.get('stripe_customer_email'),
+        'metadata': metadata
+    }
@@ -0,0 +1,109 @@
+"""Discount resolution and line-item pricing shared by the cart, product scan
+and checkout endpoints.
+
+Discounts come from the in-process active discount index (see cache.py) and
+the validity window is checked in memory, so pricing needs no discount queries
+while the index is warm and at most one when it is reloaded.
+"""
+
+from datetime import datetime
+
+from cache import discount_index
+
+
+def _product_barcode(product):
+    return product.get('barcode', product['product_id'])
+
+
+def find_discount(product, by_id, by_barcode):
+    """Pick the discount for a product: the one its discount_id points to,
+    otherwise the active discount registered for its barcode."""
+    discount = None
+    if product.get('discount_id'):
+        discount = by_id.get(str(product['discount_id']))
+    if not discount:
+        discount = by_barcode.get(_product_barcode(product))
+    return discount
+
+
+def discount_window(discount):
+    """Return the (start, end) datetimes of a discount. Plain dates cover the
+    whole of their first and last day."""
+    start_date = discount['start_date']
+    end_date = discount['end_date']
+
+    if isinstance(start_date, datetime):
+        start_datetime = start_date
+    else:
+        start_datetime = datetime.combine(start_date, datetime.min.time())
+
+    if isinstance(end_date, datetime):
+        end_datetime = end_date
+    else:
+        end_datetime = datetime.combine(end_date, datetime.max.time())
+
+    return start_datetime, end_datetime
+
+
+def is_discount_applicable(discount, now):
+    if not discount or discount.get('status') != 'Active':
+        return False
+    start_datetime, end_datetime = discount_window(discount)
+    return start_datetime <= now <= end_datetime
+
+
+def price_product(product, discount, now=None):
+    """Price a single product against an already resolved discount.
+
+    Returns a dict with the unrounded discount_price plus the applied
+    discount_percentage and discount_name (0 / None when no discount applies).
+    """
+    now = now or datetime.now()
+    price = product['price']
+    if is_discount_applicable(discount, now):
+        return {
+            'discount_price': price * (1 - discount['percentage'] / 100),
+            'discount_percentage': discount['percentage'],
+            'discount_name': discount['name']
+        }
+    return {
+        'discount_price': price,
+        'discount_percentage': 0,
+        'discount_name': None
+    }
+
+
+def price_products(db, products, quantities=None):
+    """Price a list of product documents against the active discount index.
+
+    quantities maps product_id -> quantity (defaults to 1). Each returned line
+    item carries the product document, its quantity, the pricing fields from
+    price_product() and the unrounded line_total / original_total.
+    """
+    by_id, by_barcode = discount_index.get(db)
+    return _price_items(by_id, by_barcode, products, quantities)
+
+
+async def price_products_async(db, products, quantities=None):
+    """price_products() for an asyncio (AsyncMongoClient) database."""
+    by_id, by_barcode = await discount_index.get_async(db)
+    return _price_items(by_id, by_barcode, products, quantities)
+
+
+def _price_items(by_id, by_barcode, products, quantities):
+    now = datetime.now()
+
+    items = []
+    for product in products:
+        discount = find_discount(product, by_id, by_barcode)
+        item = price_product(product, discount, now)
+        quantity = quantities.get(product['product_id'], 1) if quantities else 1
+        item.update({
+            'product': product,
+            'discount': discount,
+            'quantity': quantity,
+            'line_total': item['discount_price'] * quantity,
+            'original_total': product['price'] * quantity
+        })
+        items.append(item)
+    return items
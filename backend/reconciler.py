@@ -0,0 +1,221 @@
+"""Background reconciliation of pending Stripe payments.
+
+Payments created by create_payment_session stay Pending until something asks
+Stripe about them. The reconciler periodically picks the pending rows that have
+not been touched for a while (indexed on payment_status + updated_at), refreshes
+them from Stripe in bounded concurrent batches and writes the results back with
+one bulk write per collection. Checkout Sessions expire on Stripe's side after
+24 hours, so abandoned sessions end up Failed instead of pending forever.
+
+Enable the worker with PAYMENT_RECONCILER_ENABLED=1, or run a single pass with:
+
+    flask --app app payments reconcile
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import socket
+import threading
+
+import click
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+import stripe
+
+from db import get_database
+import payments
+
+RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', 60))
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', 100))
+RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', 4))
+# Only rows untouched for this long are picked, leaving fresh ones to the app's own polls
+RECONCILE_MIN_AGE = float(os.getenv('RECONCILE_MIN_AGE', 120))
+RECONCILE_MAX_BACKOFF = float(os.getenv('RECONCILE_MAX_BACKOFF', 900))
+
+LEASE_ID = 'payment_reconciler'
+
+# Stripe errors that mean every call will fail for a while, not just this row's
+THROTTLING_ERRORS = (stripe.error.RateLimitError, stripe.error.APIConnectionError)
+
+
+def fetch_stripe_state(session_id):
+    """Fetch a Checkout Session (and its PaymentIntent if unpaid) from Stripe."""
+    session = stripe.checkout.Session.retrieve(session_id)
+    pi_status = None
+    payment_intent_id = getattr(session, 'payment_intent', None)
+    if getattr(session, 'payment_status', None) != 'paid' and payment_intent_id:
+        pi_status = getattr(stripe.PaymentIntent.retrieve(payment_intent_id), 'status', None)
+    return payments.session_state(session, pi_status)
+
+
+def stub_state_fetcher(expire_after=timedelta(hours=24)):
+    """Local stand-in for Stripe: sessions stay unpaid until they are older
+    than Stripe's Checkout Session lifetime, then report as expired."""
+    def fetch(session_id, payment_record):
+        expired = datetime.now() - payment_record['created_at'] > expire_after
+        return payments.session_state({
+            'id': session_id,
+            'payment_status': 'unpaid',
+            'status': 'expired' if expired else 'open'
+        })
+    return fetch
+
+
+def _default_fetcher():
+    if os.getenv('RECONCILER_STRIPE_STUB') == '1':
+        return stub_state_fetcher()
+    return lambda session_id, payment_record: fetch_stripe_state(session_id)
+
+
+def reconcile_once(db, fetch=None, batch_size=RECONCILE_BATCH_SIZE,
+                   concurrency=RECONCILE_CONCURRENCY, min_age=RECONCILE_MIN_AGE):
+    """Refresh one batch of stale pending payments.
+
+    fetch(session_id, payment_record) returns a payments.session_state() dict.
+    Returns a dict of counters: checked, updated, errors, and throttled (the
+    errors that were rate limits or connection failures).
+    """
+    fetch = fetch or _default_fetcher()
+    now = datetime.now()
+    pending = list(db.payments.find(
+        {
+            'payment_status': payments.PENDING,
+            'updated_at': {'$lt': now - timedelta(seconds=min_age)},
+            'session_id': {'$exists': True}
+        },
+        {'session_id': 1, 'payment_status': 1, 'created_at': 1, 'amount': 1, 'payment_method': 1,
+         'stripe_payment_status': 1,
+         'stripe_payment_intent_status': 1, 'stripe_amount_total': 1, 'stripe_currency': 1,
+         'stripe_customer_email': 1, 'stripe_metadata': 1}
+    ).sort('updated_at', 1).limit(batch_size))
+
+    def refresh(record):
+        try:
+            return record, fetch(record['session_id'], record), None
+        except Exception as e:
+            return record, None, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(refresh, pending))
+
+    payment_ops = []
+    transaction_ops = []
+    errors = 0
+    throttled = 0
+    changed = 0
+    for record, state, error in results:
+        if error is not None:
+            errors += 1
+            if isinstance(error, THROTTLING_ERRORS):
+                throttled += 1
+            # Retry it after the rest of the queue instead of first every run
+            payment_ops.append(UpdateOne({'_id': record['_id'], 'payment_status': record['payment_status']},
+                                         {'$set': {'updated_at': now}}))
+            continue
+        new_status, updates = payments.payment_state_updates(record, state, now)
+        if new_status != record['payment_status']:
+            # Status changes also move the sales rollup, which must only happen
+            # for the writer whose conditional update matched; these are rare
+            # enough to write one by one.
+            payments.apply_payment_state(db, record, state, now)
+            changed += 1
+        elif updates:
+            payment_ops.append(UpdateOne(*updates['payment']))
+            transaction_ops.append(UpdateOne(*updates['transaction']))
+        else:
+            # Still pending: move it to the back of the queue
+            payment_ops.append(UpdateOne({'_id': record['_id']}, {'$set': {'updated_at': now}}))
+
+    if payment_ops:
+        db.payments.bulk_write(payment_ops, ordered=False)
+    if transaction_ops:
+        db.transactions.bulk_write(transaction_ops, ordered=False)
+
+    return {'checked': len(pending), 'updated': changed + len(transaction_ops), 'errors': errors,
+            'throttled': throttled}
+
+
+def _acquire_lease(db, owner, seconds):
+    """Hold a short lease so only one worker process reconciles at a time."""
+    now = datetime.now()
+    try:
+        db.locks.update_one(
+            {'_id': LEASE_ID, '$or': [{'expires_at': {'$lt': now}}, {'owner': owner}]},
+            {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Held by another live worker
+        return False
+
+
+class PaymentReconciler:
+    """Daemon thread running reconcile_once() every RECONCILE_INTERVAL seconds,
+    backing off exponentially while Stripe rate limits or cannot be reached."""
+
+    def __init__(self, interval=RECONCILE_INTERVAL, max_backoff=RECONCILE_MAX_BACKOFF, fetch=None):
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.fetch = fetch
+        self._stop = threading.Event()
+        self._thread = None
+        self.failures = 0
+        self.last_result = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='payment-reconciler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _next_delay(self):
+        if not self.failures:
+            return self.interval
+        return min(self.max_backoff, self.interval * 2 ** self.failures)
+
+    def _run(self):
+        # Resolved in the thread so a pre-forked worker uses its own pid
+        owner = f'{socket.gethostname()}:{os.getpid()}'
+        while not self._stop.is_set():
+            try:
+                db = get_database()
+                # Lease outlives one sleep so a live holder keeps it between runs
+                if _acquire_lease(db, owner, self._next_delay() * 2):
+                    self.last_result = reconcile_once(db, fetch=self.fetch)
+                    # Only rate limits and outages slow the next run down; a row
+                    # that fails on its own just moves to the back of the queue
+                    self.failures = self.failures + 1 if self.last_result['throttled'] else 0
+            except Exception:
+                self.failures += 1
+            self._stop.wait(self._next_delay())
+
+
+reconciler = PaymentReconciler()
+
+
+def start_reconciler():
+    """Start the background worker in this process if enabled by configuration."""
+    if os.getenv('PAYMENT_RECONCILER_ENABLED') == '1':
+        reconciler.start()
+    return reconciler
+
+
+payments_cli = AppGroup('payments', help='Payment maintenance commands.')
+
+
+@payments_cli.command('reconcile')
+@click.option('--batch-size', default=RECONCILE_BATCH_SIZE, show_default=True)
+@click.option('--min-age', default=RECONCILE_MIN_AGE, show_default=True,
+              help='Only refresh rows untouched for this many seconds.')
+def reconcile_command(batch_size, min_age):
+    """Refresh one batch of stale pending payments."""
+    result = reconcile_once(get_database(), batch_size=batch_size, min_age=min_age)
+    click.echo(f"Checked {result['checked']}, updated {result['updated']}, errors {result['errors']} "
+               f"({result['throttled']} rate limited or unreachable)")
@@ -0,0 +1,100 @@
+"""Local fake Stripe event generator for exercising the webhook endpoint.
+
+Builds a Checkout Session event, signs it the way Stripe does (the
+Stripe-Signature header is t=<timestamp>,v1=<HMAC-SHA256 of "t.payload">)
+with STRIPE_WEBHOOK_SECRET and posts it to the running backend:
+
+    python stripe_fake.py cs_test_123 --event checkout.session.completed --paid
+    python stripe_fake.py cs_test_123 --event checkout.session.async_payment_failed
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+import dotenv
+
+dotenv.load_dotenv()
+
+DEFAULT_URL = 'http://localhost:5000/users/stripe/webhook'
+
+
+def build_event(session_id, event_type='checkout.session.completed', paid=False,
+                amount_total=None, currency='inr', metadata=None):
+    """Return a Stripe-shaped event dict wrapping a Checkout Session."""
+    if event_type == 'checkout.session.async_payment_succeeded':
+        paid = True
+    return {
+        'id': f'evt_fake_{int(time.time() * 1000)}',
+        'object': 'event',
+        'type': event_type,
+        'created': int(time.time()),
+        'livemode': False,
+        'data': {
+            'object': {
+                'id': session_id,
+                'object': 'checkout.session',
+                'status': 'expired' if event_type == 'checkout.session.expired' else 'complete',
+                'payment_status': 'paid' if paid else 'unpaid',
+                'amount_total': amount_total,
+                'currency': currency,
+                'customer_details': {'email': 'test@example.com'},
+                'metadata': metadata or {},
+                'payment_intent': None
+            }
+        }
+    }
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Return the Stripe-Signature header value for a raw payload string."""
+    timestamp = timestamp or int(time.time())
+    signed = f'{timestamp}.{payload}'.encode('utf-8')
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def send_event(event, secret, url=DEFAULT_URL):
+    """POST a signed event to the webhook; returns (status code, body)."""
+    payload = json.dumps(event)
+    req = urllib.request.Request(
+        url,
+        data=payload.encode('utf-8'),
+        headers={
+            'Content-Type': 'application/json',
+            'Stripe-Signature': sign_payload(payload, secret)
+        },
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, resp.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send a signed fake Stripe Checkout Session event.')
+    parser.add_argument('session_id')
+    parser.add_argument('--event', default='checkout.session.completed')
+    parser.add_argument('--paid', action='store_true', help='mark the session as paid')
+    parser.add_argument('--amount', type=int, default=None, help='amount_total in paise')
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--secret', default=os.getenv('STRIPE_WEBHOOK_SECRET'))
+    args = parser.parse_args()
+
+    if not args.secret:
+        parser.error('STRIPE_WEBHOOK_SECRET is not set; pass --secret')
+
+    event = build_event(args.session_id, args.event, args.paid, args.amount)
+    status, body = send_event(event, args.secret, args.url)
+    print(status, body)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""place_order_async against an in-memory stand-in for AsyncMongoClient.
+
+    cd backend && python -m unittest discover tests
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import checkout
+from cache import discount_index, user_name_cache
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict) and '$in' in condition:
+            if doc.get(field) not in condition['$in']:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else self.docs
+
+
+class FakeCollection:
+    """Records each write when it is issued, i.e. when its coroutine is created."""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = []
+
+    def _issue(self, operation, session, apply):
+        self.db.issued.append(f'{self.name}.{operation}')
+        self.db.sessions.add(session)
+        failure = self.db.failures.get(f'{self.name}.{operation}')
+
+        async def run():
+            await asyncio.sleep(0)
+            if failure:
+                raise failure
+            self.db.completed.append(f'{self.name}.{operation}')
+            return apply()
+        return run()
+
+    def find(self, query, projection=None):
+        return FakeCursor([d for d in self.docs if _matches(d, query)])
+
+    async def find_one(self, query, projection=None):
+        return next((d for d in self.docs if _matches(d, query)), None)
+
+    def insert_one(self, doc, session=None):
+        return self._issue('insert_one', session, lambda: self.docs.append(doc))
+
+    def insert_many(self, docs, session=None):
+        return self._issue('insert_many', session, lambda: self.docs.extend(docs))
+
+    def update_one(self, query, update, upsert=False, session=None):
+        def apply():
+            for doc in self.docs:
+                if _matches(doc, query):
+                    doc.update(update.get('$set', {}))
+                    for field in update.get('$unset', {}):
+                        doc.pop(field, None)
+                    return
+            if upsert:
+                self.docs.append(dict(query))
+        return self._issue('update_one', session, apply)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+        self.issued = []
+        self.completed = []
+        self.sessions = set()
+        self.failures = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, name))
+
+    __getattr__ = __getitem__
+
+
+class PlaceOrderAsyncTest(unittest.TestCase):
+
+    def setUp(self):
+        user_name_cache.clear()
+        discount_index.invalidate()
+        self.db = FakeDatabase()
+        self.db.users.docs.append({'phone_number': '999', 'name': 'Asha'})
+        self.db.products.docs.extend([
+            {'product_id': 'p1', 'name': 'Milk', 'price': 50.0, 'stck_qty': 10},
+            {'product_id': 'p2', 'name': 'Bread', 'price': 20.0, 'stck_qty': 10},
+        ])
+        self.db.cart_items.docs.append({'cart_id': '999', 'items': {'p1': 2, 'p2': 1}})
+        self.session = None
+        self._transaction = checkout.run_in_transaction_async
+        checkout.run_in_transaction_async = lambda callback: callback(self.session)
+
+    def tearDown(self):
+        checkout.run_in_transaction_async = self._transaction
+
+    def place_order(self):
+        return asyncio.run(checkout.place_order_async(self.db, '999', 'card', 'Addr'))
+
+    def test_writes_order_then_rollup_then_clears_cart(self):
+        result, timings = self.place_order()
+
+        self.assertEqual(result['total_amount'], 120.0)
+        self.assertEqual(len(self.db.orders.docs), 1)
+        self.assertEqual(len(self.db.order_items.docs), 2)
+        self.assertEqual(len(self.db.payments.docs), 1)
+        self.assertEqual(self.db.cart_items.docs[0]['items'], {})
+        self.assertEqual(self.db.completed[-2:], ['sales_daily.update_one', 'cart_items.update_one'])
+        self.assertIn('commit', timings)
+
+    def test_failed_insert_keeps_the_cart(self):
+        self.db.failures['payments.insert_one'] = RuntimeError('insert failed')
+
+        with self.assertRaises(RuntimeError):
+            self.place_order()
+
+        self.assertEqual(self.db.cart_items.docs[0]['items'], {'p1': 2, 'p2': 1})
+        self.assertNotIn('sales_daily.update_one', self.db.issued)
+        self.assertNotIn('cart_items.update_one', self.db.issued)
+
+    def test_transaction_writes_one_at_a_time_on_the_session(self):
+        self.session = object()
+
+        self.place_order()
+
+        self.assertEqual(self.db.issued, self.db.completed)
+        self.assertEqual(self.db.sessions, {self.session})
+
+    def test_transaction_stops_issuing_after_a_failure(self):
+        self.session = object()
+        self.db.failures['orders.insert_one'] = RuntimeError('insert failed')
+
+        with self.assertRaises(RuntimeError):
+            self.place_order()
+
+        # Nothing is left created but never awaited
+        self.assertEqual(self.db.issued, ['orders.insert_one'])
+
+    def test_empty_cart_is_rejected(self):
+        self.db.cart_items.docs[0]['items'] = {}
+
+        with self.assertRaises(checkout.CheckoutError):
+            self.place_order()
+
+        self.assertEqual(self.db.issued, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
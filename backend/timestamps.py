@@ -0,0 +1,124 @@
+"""Normalization of legacy string timestamps to BSON dates.
+
+Older payments and orders stored created_at and similar fields as strings,
+which forced every date filter through $toDate or $regex. normalize_timestamps
+rewrites them in batches, in _id order, and records the last _id processed
+per collection in migration_progress so an interrupted run resumes where it
+stopped. Strings that cannot be parsed are left alone and reported.
+
+Once the data is clean, enforce_timestamp_types installs a collection
+validator so writes can no longer store these fields as anything but dates.
+
+    flask --app app db normalize-timestamps
+"""
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+# Timestamp fields per collection
+TIMESTAMP_FIELDS = {
+    'payments': ('created_at', 'updated_at'),
+    'transactions': ('created_at', 'updated_at', 'transaction_date'),
+    'orders': ('order_date', 'created_at', 'updated_at'),
+    'order_items': ('created_at',),
+}
+
+PROGRESS_COLLECTION = 'migration_progress'
+NAMESPACE_NOT_FOUND = 26
+
+
+def parse_timestamp(value):
+    """Parse a legacy timestamp string into a naive local datetime, or None.
+
+    Accepts ISO 8601 with or without time, 'T' separator, fractions and
+    offset (e.g. JavaScript's toISOString); offsets are converted to local
+    time to match datetime.now() used by the write paths.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def normalize_collection(db, collection, fields, batch_size=1000):
+    """Convert one collection's string timestamps. Returns (converted, unparseable)."""
+    progress_id = f'normalize_timestamps:{collection}'
+    progress = db[PROGRESS_COLLECTION].find_one({'_id': progress_id}) or {}
+    last_id = progress.get('last_id')
+    string_filter = {'$or': [{field: {'$type': 'string'}} for field in fields]}
+    converted = 0
+    unparseable = 0
+
+    while True:
+        query = string_filter if last_id is None else {'$and': [string_filter, {'_id': {'$gt': last_id}}]}
+        batch = list(db[collection].find(query, {field: 1 for field in fields}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        ops = []
+        for doc in batch:
+            updates = {}
+            for field in fields:
+                value = doc.get(field)
+                if isinstance(value, str):
+                    parsed = parse_timestamp(value)
+                    if parsed is None:
+                        unparseable += 1
+                    else:
+                        updates[field] = parsed
+            if updates:
+                # Only replace values that are still the strings we read
+                match = {'_id': doc['_id'], **{field: doc[field] for field in updates}}
+                ops.append(UpdateOne(match, {'$set': updates}))
+        if ops:
+            converted += db[collection].bulk_write(ops, ordered=False).modified_count
+        last_id = batch[-1]['_id']
+        db[PROGRESS_COLLECTION].update_one(
+            {'_id': progress_id},
+            {'$set': {'last_id': last_id, 'updated_at': datetime.now()}},
+            upsert=True
+        )
+    return converted, unparseable
+
+
+def reset_progress(db):
+    """Forget saved positions so the next run rescans from the first _id."""
+    db[PROGRESS_COLLECTION].delete_many({'_id': {'$regex': '^normalize_timestamps:'}})
+
+
+def normalize_timestamps(db, batch_size=1000):
+    """Convert every declared timestamp field. Returns {collection: (converted, unparseable)}."""
+    return {
+        collection: normalize_collection(db, collection, fields, batch_size)
+        for collection, fields in TIMESTAMP_FIELDS.items()
+    }
+
+
+def enforce_timestamp_types(db):
+    """Reject writes that store a declared timestamp field as anything but a date.
+
+    validationLevel 'moderate' leaves updates to documents that were already
+    invalid (unparseable legacy rows) alone; the fields stay optional.
+    """
+    for collection, fields in TIMESTAMP_FIELDS.items():
+        validator = {'$jsonSchema': {'properties': {field: {'bsonType': 'date'} for field in fields}}}
+        try:
+            db.command('collMod', collection, validator=validator, validationLevel='moderate')
+            continue
+        except OperationFailure as e:
+            if e.code != NAMESPACE_NOT_FOUND:
+                raise
+        try:
+            db.create_collection(collection, validator=validator, validationLevel='moderate')
+        except CollectionInvalid:
+            # Created by a concurrent writer in the meantime
+            db.command('collMod', collection, validator=validator, validationLevel='moderate')
+
+
+def migrate_timestamps(db):
+    normalize_timestamps(db)
+    enforce_timestamp_types(db)
@@ -1,16 +1,28 @@
 # ------------------ Payments API for Profile Graph ------------------
 
-from flask import Blueprint, request, jsonify
-from db import get_db
+from flask import Blueprint, current_app, request, jsonify
+from db import get_db, get_executor, supports_client_bulk_write
+import checkout
+from conditional import conditional
+import payments
+from pricing import discount_window, price_products
+from cache import discount_view, get_product, invalidate_product, payment_status_cache
+from carts import (CART_FIELDS, cart_quantities, change_update, convert_list_cart, decrement_update,
+                   has_legacy_list, increment_update, item_path)
+from rollups import record_payment
+from pymongo import UpdateOne
+from werkzeug.http import generate_etag
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from collections import Counter
 import stripe
 import dotenv, os
 
 dotenv.load_dotenv()
 
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Signing secret of the webhook endpoint; when set, payment status is driven
+# by Stripe events and status polls are answered from the database
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 users_bp = Blueprint('users', __name__)
 
@@ -34,10 +46,7 @@ def get_user_payments():
             {'_id': 0}
         ).sort('created_at', -1).limit(7))
 
-        # Format dates for frontend
-        for payment in payments:
-            if 'created_at' in payment and isinstance(payment['created_at'], datetime):
-                payment['created_at'] = payment['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+        # Dates are formatted by the app's JSON provider
         return jsonify({'payments': payments}), 200
     except Exception as e:
         return jsonify({'message': f'Error fetching payments: {str(e)}'}), 500
@@ -53,80 +62,28 @@ def get_products():
     db = get_db()
     cart = db.cart_items.find_one({'cart_id': data['phone_number']})
     
-    # Get the product_ids list from the cart
-    if 'product_id' not in cart or not isinstance(cart['product_id'], list):
-        return jsonify({'products': []}), 200
+    # Quantities are stored per product_id in the cart's items map
+    product_counts = cart_quantities(cart)
     
-    product_ids = cart['product_id']
-    
-    # Count occurrences of each product_id to get quantities
-    product_counts = Counter(product_ids)
-    
-    # Fetch product details for unique product_ids with discount information
+    # Fetch product details for unique product_ids and price them in one batch
     products = []
     if product_counts:
         # Get unique product IDs to fetch from database
         unique_product_ids = list(product_counts.keys())
         product_details = db.products.find({'product_id': {'$in': unique_product_ids}})
-        
-        for product in product_details:
-            # Check if product has an active discount
-            discount_price = product['price']
-            discount_percentage = 0
-            discount_name = None
-            
-            discount = None
-            
-            # First: Check if product has discount_id field
-            if 'discount_id' in product and product['discount_id']:
-                discount = db.discounts.find_one({'_id': product['discount_id']})
-            
-            # Second: If no discount found via discount_id, search by product_barcode
-            if not discount:
-                # Try to find discount by product_barcode matching product_id or barcode
-                product_barcode = product.get('barcode', product['product_id'])
-                discount = db.discounts.find_one({
-                    'product_barcode': product_barcode,
-                    'status': 'Active'
-                })
-            
-            if discount and discount['status'] == 'Active':
-                # Check if discount is within valid date range
-                current_datetime = datetime.now()
-                
-                # Handle both datetime and date objects for comparison
-                start_date = discount['start_date']
-                end_date = discount['end_date']
-                
-                # Convert to datetime if they are date objects
-                if hasattr(start_date, 'date'):  # It's a datetime object
-                    start_datetime = start_date
-                else:  # It's a date object, convert to datetime
-                    start_datetime = datetime.combine(start_date, datetime.min.time())
-                
-                if hasattr(end_date, 'date'):  # It's a datetime object
-                    end_datetime = end_date
-                else:  # It's a date object, convert to datetime
-                    end_datetime = datetime.combine(end_date, datetime.max.time())
-                
-                if start_datetime <= current_datetime <= end_datetime:
-                    discount_percentage = discount['percentage']
-                    discount_price = product['price'] * (1 - discount_percentage / 100)
-                    discount_name = discount['name']
-            
-            # Get quantity for this product
-            quantity = product_counts[product['product_id']]
-            
+
+        for item in price_products(db, product_details, product_counts):
+            product = item['product']
             products.append({
                 'product_id': product['product_id'],
                 'name': product['name'],
                 'price': product['price'],
-                'discount_price': round(discount_price, 2),
-                'discount_percentage': discount_percentage,
-                'discount_name': discount_name,
-                'quantity': quantity,
-                'total_price': round(discount_price * quantity, 2),
-                'original_total': round(product['price'] * quantity, 2)
+                'discount_price': round(item['discount_price'], 2),
+                'discount_percentage': item['discount_percentage'],
+                'discount_name': item['discount_name'],
+                'quantity': item['quantity'],
+                'total_price': round(item['line_total'], 2),
+                'original_total': round(item['original_total'], 2)
             })
     
     return jsonify({'products': products}), 200
@@ -138,6 +95,11 @@ def add_products():
     if not data or not all(field in data for field in required_fileds):
         return jsonify({'message': 'Missing required fields'}), 400
     
+    try:
+        item_path(data['product_id'])
+    except ValueError:
+        return jsonify({'message': 'Invalid product_id'}), 400
+    
     db = get_db()
     
     # First, atomically decrease stock by 1 only if stock > 0
@@ -149,27 +111,22 @@ def add_products():
     if stock_update_result.modified_count == 0:
         # Either product not found or out of stock
         return jsonify({'message': 'Product not found or out of stock'}), 400
+    invalidate_product(data['product_id'])
     
-    # Then, add the product to the cart
-    cart = db.cart_items.find_one({'cart_id': data['phone_number']})
-    if not cart:
+    # Then, atomically add one unit to the cart's quantity map
+    cart_update_result = db.cart_items.update_one(
+        {'cart_id': data['phone_number']},
+        increment_update({data['product_id']: 1})
+    )
+    if cart_update_result.matched_count == 0:
         # Roll back stock decrement if cart not found
         db.products.update_one(
             {'product_id': data['product_id']},
             {'$inc': {'stck_qty': 1}}
         )
+        invalidate_product(data['product_id'])
         return jsonify({'message': 'Cart not found'}), 404
     
-    # Ensure cart has a list for product_id
-    if 'product_id' not in cart or not isinstance(cart['product_id'], list):
-        cart['product_id'] = []
-    
-    cart['product_id'].append(data['product_id'])
-    db.cart_items.update_one(
-        {'cart_id': data['phone_number']}, 
-        {'$set': {'product_id': cart['product_id']}}
-    )
-    
     return jsonify({'message': 'Product added to cart after decreasing stock'}), 200
 
 @users_bp.route('/users/carts/delete_product', methods=['POST'])
@@ -179,120 +136,265 @@ def delete_products():
     if not data or not all(field in data for field in required_fileds):
         return jsonify({'message': 'Missing required fields'}), 400
     
-    db = get_db()
+    try:
+        cart_field = item_path(data['product_id'])
+    except ValueError:
+        return jsonify({'message': 'Invalid product_id'}), 400
     
-    # Find the cart by phone_number
-    cart = db.cart_items.find_one({'cart_id': data['phone_number']})
-    if not cart:
-        return jsonify({'message': 'Cart not found'}), 404
+    db = get_db()
     
-    # Check if product exists in cart
-    if 'product_id' not in cart or not isinstance(cart['product_id'], list):
-        return jsonify({'message': 'No products in cart'}), 400
+    # First, atomically take one unit out of the cart; the filter only matches
+    # when the product is actually in the cart
+    cart_filter = {'cart_id': data['phone_number'], cart_field: {'$gte': 1}}
+    cart_update_result = db.cart_items.update_one(cart_filter, decrement_update({data['product_id']: 1}))
     
-    # Check if product is actually in the cart
-    if data['product_id'] not in cart['product_id']:
-        return jsonify({'message': 'Product not found in cart'}), 404
+    if cart_update_result.matched_count == 0:
+        # Distinguish a missing cart from a product that is not in it
+        cart = db.cart_items.find_one({'cart_id': data['phone_number']}, {'product_id': 1})
+        if cart is None:
+            return jsonify({'message': 'Cart not found'}), 404
+        if has_legacy_list(cart):
+            # Not converted by the migrations yet: convert it and retry
+            convert_list_cart(db, data['phone_number'])
+            cart_update_result = db.cart_items.update_one(cart_filter, decrement_update({data['product_id']: 1}))
+        if cart_update_result.matched_count == 0:
+            return jsonify({'message': 'Product not found in cart'}), 404
     
-    # First, increment the product stock by 1
+    # Then, increment the product stock by 1
     stock_update_result = db.products.update_one(
         {'product_id': data['product_id']},
         {'$inc': {'stck_qty': 1}}
     )
     
     if stock_update_result.modified_count == 0:
-        return jsonify({'message': 'Product not found in products collection'}), 404
-    
-    # Then, remove the product from cart
-    cart['product_id'].remove(data['product_id'])
-    
-    # Update the cart
-    db.cart_items.update_one(
-        {'cart_id': data['phone_number']}, 
-        {'$set': {'product_id': cart['product_id']}}
-    )
+        # The product left the catalog; the unit is still taken out of the cart
+        return jsonify({'message': 'Product removed from cart (not found in products collection)'}), 200
+    invalidate_product(data['product_id'])
     
     return jsonify({'message': 'Product stock increased and removed from cart'}), 200
 
+# Conditional cart writes retried after losing a race with another removal
+CART_WRITE_ATTEMPTS = 3
+# Concurrent stock updates per batch on servers without client bulk writes
+STOCK_WRITE_THREADS = int(os.getenv('STOCK_WRITE_THREADS', 8))
+
+def _reserve_stock(db, additions):
+    """Take each {product_id: qty} out of stock where enough is left and
+    return the product_ids whose stock was taken.
+
+    A collection bulk write only reports totals, so on MongoDB 8.0+ the lines
+    go out as one client bulk write with per-operation results; older servers
+    get one conditional update per line, sent concurrently.
+    """
+    lines = [({'product_id': pid, 'stck_qty': {'$gte': qty}}, {'$inc': {'stck_qty': -qty}})
+             for pid, qty in additions.items()]
+    if supports_client_bulk_write(db.client):
+        result = db.client.bulk_write(
+            [UpdateOne(f, u, namespace=db.products.full_name) for f, u in lines],
+            ordered=False, verbose_results=True
+        )
+        matched = [result.update_results[i].matched_count for i in range(len(lines))]
+    else:
+        pool = get_executor('stock', STOCK_WRITE_THREADS)
+        matched = list(pool.map(lambda line: db.products.update_one(*line).matched_count, lines))
+    return {pid for pid, n in zip(additions, matched) if n}
+
+def _release_stock(db, quantities):
+    """Add {product_id: qty} back to stock in one bulk write."""
+    if quantities:
+        db.products.bulk_write([UpdateOne({'product_id': pid}, {'$inc': {'stck_qty': qty}})
+                                for pid, qty in quantities.items()], ordered=False)
+
+@users_bp.route('/users/carts/bulk_update', methods=['POST'])
+def bulk_update_cart():
+    """Add and remove several products in one request.
+
+    Body: {'phone_number': ..., 'items': [{'product_id': ..., 'quantity': n}, ...]}
+    A positive quantity adds units, a negative one removes them. Adding costs
+    three database round trips however many lines are sent: one read of the
+    cart and current stock, one stock reservation and one cart write.
+    Removals add one bulk write returning their units to stock, and losing
+    a race adds a read.
+    """
+    data = request.get_json()
+    required_fields = ['phone_number', 'items']
+    if not data or not all(field in data for field in required_fields) or not isinstance(data['items'], list):
+        return jsonify({'message': 'Missing required fields'}), 400
+
+    # Net quantity per product, so repeated lines collapse into one operation
+    requested = {}
+    failed = []
+    for line in data['items']:
+        if not isinstance(line, dict):
+            failed.append({'product_id': None, 'quantity': None, 'reason': 'Invalid line'})
+            continue
+        product_id = line.get('product_id')
+        try:
+            quantity = int(line.get('quantity', 1))
+            item_path(product_id)
+        except (TypeError, ValueError):
+            failed.append({'product_id': product_id, 'quantity': line.get('quantity'), 'reason': 'Invalid line'})
+            continue
+        if quantity == 0:
+            failed.append({'product_id': product_id, 'quantity': 0, 'reason': 'Invalid quantity'})
+            continue
+        requested[product_id] = requested.get(product_id, 0) + quantity
+
+    db = get_db()
+
+    # Round trip 1: the cart together with the stock of every requested product
+    snapshot = next(db.cart_items.aggregate([
+        {'$match': {'cart_id': data['phone_number']}},
+        {'$limit': 1},
+        {'$lookup': {
+            'from': 'products',
+            'pipeline': [
+                {'$match': {'product_id': {'$in': list(requested)}}},
+                {'$project': {'_id': 0, 'product_id': 1, 'stck_qty': 1}}
+            ],
+            'as': 'stock'
+        }}
+    ]), None)
+    if not snapshot:
+        return jsonify({'message': 'Cart not found'}), 404
+
+    in_cart = cart_quantities(snapshot)
+    if has_legacy_list(snapshot):
+        # Not converted by the migrations yet; the writes below need the map
+        convert_list_cart(db, data['phone_number'])
+    stock = {p['product_id']: p.get('stck_qty', 0) for p in snapshot['stock']}
+
+    additions = {}
+    removals = {}
+    for product_id, quantity in requested.items():
+        if quantity > 0:
+            if product_id not in stock:
+                failed.append({'product_id': product_id, 'quantity': quantity, 'reason': 'Product not found'})
+            elif stock[product_id] < quantity:
+                failed.append({'product_id': product_id, 'quantity': quantity, 'reason': 'Insufficient stock'})
+            else:
+                additions[product_id] = quantity
+        elif quantity < 0:
+            # Never remove more units than the cart holds
+            quantity = min(-quantity, in_cart.get(product_id, 0))
+            if quantity == 0:
+                failed.append({'product_id': product_id, 'quantity': -requested[product_id], 'reason': 'Product not found in cart'})
+            else:
+                removals[product_id] = quantity
+        else:
+            # Additions and removals of the product cancel out
+            failed.append({'product_id': product_id, 'quantity': 0, 'reason': 'Invalid quantity'})
+
+    if not additions and not removals:
+        return jsonify({'message': 'No cart changes applied', 'added': {}, 'removed': {}, 'failed': failed}), 400
+
+    # Round trip 2: reserve the stock of every addition, conditional on enough
+    # stock. Lines that lost the stock to a concurrent scan since the snapshot
+    # (or whose product was deleted) are told apart with one more read.
+    if additions:
+        reserved = _reserve_stock(db, additions)
+        if len(reserved) < len(additions):
+            existing = {p['product_id'] for p in db.products.find(
+                {'product_id': {'$in': [pid for pid in additions if pid not in reserved]}},
+                {'_id': 0, 'product_id': 1}
+            )}
+            for product_id in list(additions):
+                if product_id not in reserved:
+                    reason = 'Insufficient stock' if product_id in existing else 'Product not found'
+                    failed.append({'product_id': product_id, 'quantity': additions.pop(product_id), 'reason': reason})
+
+    # Round trip 3: one pipeline update applying every cart line change. The
+    # filter requires each removed quantity to still be in the cart, so two
+    # concurrent removals cannot both return the same unit to stock.
+    attempts = 0
+    try:
+        while additions or removals:
+            cart_filter = {'cart_id': data['phone_number']}
+            cart_filter.update({item_path(pid): {'$gte': qty} for pid, qty in removals.items()})
+            if db.cart_items.update_one(cart_filter, change_update(additions, removals)).matched_count:
+                break
+            cart = db.cart_items.find_one({'cart_id': data['phone_number']}, CART_FIELDS)
+            if not cart:
+                # Cart disappeared meanwhile; give the reserved stock back
+                _release_stock(db, additions)
+                invalidate_product(*requested)
+                return jsonify({'message': 'Cart not found'}), 404
+            # Another request removed units first: retry with what is left
+            attempts += 1
+            in_cart = cart_quantities(cart)
+            for product_id in list(removals):
+                quantity = min(removals[product_id], in_cart.get(product_id, 0))
+                if quantity == 0 or attempts >= CART_WRITE_ATTEMPTS:
+                    failed.append({'product_id': product_id, 'quantity': removals.pop(product_id), 'reason': 'Product not found in cart'})
+                else:
+                    removals[product_id] = quantity
+    except Exception:
+        # The units never reached the cart, so they go back to stock
+        _release_stock(db, additions)
+        invalidate_product(*requested)
+        raise
+
+    # Round trip 4 (removals only): return removed units to stock
+    _release_stock(db, removals)
+    invalidate_product(*requested)
+
+    return jsonify({
+        'message': 'Cart updated',
+        'added': additions,
+        'removed': removals,
+        'failed': failed
+    }), 200
+
+def _discount_debug(product, item):
+    """Explain how the discount for a priced product was resolved"""
+    discount = item['discount']
+    debug_info = []
+    if product.get('discount_id'):
+        debug_info.append(f"Product has discount_id: {product['discount_id']}")
+    if not discount:
+        debug_info.append(f"No discount found for product_barcode: {product.get('barcode', product['product_id'])}")
+        return debug_info
+    debug_info.append(f"Found discount: {discount['name']}, Status: {discount['status']}")
+    start_datetime, end_datetime = discount_window(discount)
+    debug_info.append(f"Discount period: {start_datetime} to {end_datetime}")
+    if item['discount_name'] is not None:
+        debug_info.append(f"DISCOUNT APPLIED: {item['discount_percentage']}% off")
+    elif discount['status'] != 'Active':
+        debug_info.append("Discount is not Active")
+    else:
+        debug_info.append("Discount is outside valid date range")
+    return debug_info
+
+def _product_etag(product_id):
+    # Cached product document plus its discount and whether that applies right
+    # now, all from memory and the same in every worker; errors are left to
+    # the view
+    db = get_db()
+    try:
+        product = get_product(db, product_id)
+        if not product:
+            return None
+        item = price_products(db, [product])[0]
+    except Exception:
+        return None
+    state = (product, item['discount'], item['discount_percentage'], item['discount_name'])
+    return 'product-' + generate_etag(repr(state).encode('utf-8'))
+
 @users_bp.route('/products/<product_id>', methods=['GET'])
+@conditional(_product_etag)
 def get_product_by_id(product_id):
     """Get a single product by product_id/barcode with discount information"""
     db = get_db()
     try:
-        # Find product by product_id (which could be barcode) or by barcode field
-        product = db.products.find_one({'product_id': product_id})
-        if not product:
-            # Also try searching by barcode field
-            product = db.products.find_one({'barcode': product_id})
+        # Find product by product_id (which could be barcode) or by barcode field;
+        # served from the product cache, including cached misses
+        product = get_product(db, product_id)
         
         if not product:
             return jsonify({'message': 'Product not found'}), 404
         
-        # Check if product has an active discount
-        discount_price = product['price']
-        discount_percentage = 0
-        discount_name = None
-        discount_debug_info = []
-        
-        discount = None
-        
-        # First: Check if product has discount_id field
-        if 'discount_id' in product and product['discount_id']:
-            discount_debug_info.append(f"Product has discount_id: {product['discount_id']}")
-            discount = db.discounts.find_one({'_id': product['discount_id']})
-            if discount:
-                discount_debug_info.append(f"Found discount via discount_id: {discount['name']}")
-        
-        # Second: If no discount found via discount_id, search by product_barcode
-        if not discount:
-            # Try to find discount by product_barcode matching product_id or barcode
-            product_barcode = product.get('barcode', product['product_id'])
-            discount = db.discounts.find_one({
-                'product_barcode': product_barcode,
-                'status': 'Active'
-            })
-            if discount:
-                discount_debug_info.append(f"Found discount via product_barcode match: {discount['name']}")
-            else:
-                discount_debug_info.append(f"No discount found for product_barcode: {product_barcode}")
-        
-        if not discount:
-            discount_debug_info.append("No discount found for this product")
-        else:
-            discount_debug_info.append(f"Found discount: {discount['name']}, Status: {discount['status']}")
-            
-            if discount['status'] != 'Active':
-                discount_debug_info.append("Discount is not Active")
-            else:
-                # Check if discount is within valid date range
-                current_datetime = datetime.now()
-                discount_debug_info.append(f"Current datetime: {current_datetime}")
-                
-                # Handle both datetime and date objects for comparison
-                start_date = discount['start_date']
-                end_date = discount['end_date']
-                discount_debug_info.append(f"Discount period: {start_date} to {end_date}")
-                
-                # Convert to datetime if they are date objects
-                if hasattr(start_date, 'date'):  # It's a datetime object
-                    start_datetime = start_date
-                else:  # It's a date object, convert to datetime
-                    start_datetime = datetime.combine(start_date, datetime.min.time())
-                
-                if hasattr(end_date, 'date'):  # It's a datetime object
-                    end_datetime = end_date
-                else:  # It's a date object, convert to datetime
-                    end_datetime = datetime.combine(end_date, datetime.max.time())
-                
-                discount_debug_info.append(f"Converted period: {start_datetime} to {end_datetime}")
-                
-                if start_datetime <= current_datetime <= end_datetime:
-                    discount_percentage = discount['percentage']
-                    discount_price = product['price'] * (1 - discount_percentage / 100)
-                    discount_name = discount['name']
-                    discount_debug_info.append(f"DISCOUNT APPLIED: {discount_percentage}% off")
-                else:
-                    discount_debug_info.append("Discount is outside valid date range")
+        # Price the product against the in-memory discount index
+        item = price_products(db, [product])[0]
         
         # Return product with discount information
         product_data = {
@@ -301,74 +403,108 @@ def get_product_by_id(product_id):
             'barcode': product.get('barcode', product['product_id']),
             'description': product.get('description', ''),
             'price': product['price'],
-            'discount_price': round(discount_price, 2),
-            'discount_percentage': discount_percentage,
-            'discount_name': discount_name,
+            'discount_price': round(item['discount_price'], 2),
+            'discount_percentage': item['discount_percentage'],
+            'discount_name': item['discount_name'],
             'stck_qty': product['stck_qty'],
             'image_url': product.get('image_url', ''),
             'is_active': product.get('is_active', True),
-            'created_at': product.get('created_at', ''),
-            'discount_debug': discount_debug_info  # Remove this after debugging
+            'created_at': product.get('created_at', '')
         }
+
+        # Discount resolution trace, only built on request (?debug=1)
+        if request.args.get('debug'):
+            product_data['discount_debug'] = _discount_debug(product, item)
         
         return jsonify(product_data), 200
         
     except Exception as e:
         return jsonify({'message': f'Error fetching product: {str(e)}'}), 500
 
+def _product_lookup(local_field, foreign_field, name):
+    # Equality lookups on indexed product fields; only the first match is used
+    return {'$lookup': {
+        'from': 'products',
+        'localField': local_field,
+        'foreignField': foreign_field,
+        'pipeline': [
+            {'$project': {'_id': 0, 'name': 1, 'barcode': 1, 'product_id': 1, 'price': 1}},
+            {'$limit': 1}
+        ],
+        'as': name
+    }}
+
+
+def _discount_view_pipeline(now):
+    """Active discounts joined to their products in one aggregation, plus the
+    next start_date so the cached response can expire when it takes effect."""
+    return [
+        {'$match': {'status': 'Active', 'end_date': {'$gte': now}}},
+        {'$facet': {
+            'current': [
+                {'$match': {'start_date': {'$lte': now}}},
+                # Same precedence as before: barcode, then product_id, then discount_id
+                _product_lookup('product_barcode', 'barcode', 'by_barcode'),
+                _product_lookup('product_barcode', 'product_id', 'by_product_id'),
+                _product_lookup('_id', 'discount_id', 'by_discount_id'),
+                {'$addFields': {'product': {'$first': {'$concatArrays': [
+                    '$by_barcode', '$by_product_id', '$by_discount_id'
+                ]}}}},
+                {'$match': {'product': {'$ne': None}}},
+                {'$project': {'by_barcode': 0, 'by_product_id': 0, 'by_discount_id': 0}}
+            ],
+            'next_start': [
+                {'$match': {'start_date': {'$gt': now}}},
+                {'$group': {'_id': None, 'at': {'$min': '$start_date'}}}
+            ]
+        }}
+    ]
+
+
 @users_bp.route('/users/view_discounts', methods=['GET'])
+@conditional(lambda: discount_view.etag())
 def view_discounts():
+    # Served from the cached body until it expires or an admin write invalidates it
+    body = discount_view.get()
+    if body is not None:
+        return current_app.response_class(body, status=200, mimetype='application/json')
+
     db = get_db()
     try:
-        # Get all active discounts that are currently valid
+        version = discount_view.version
         current_datetime = datetime.now()
-        current_date = current_datetime.date()
-        
-        # Find active discounts within valid date range
-        # Convert current_date to datetime for MongoDB comparison
-        active_discounts = db.discounts.find({
-            'status': 'Active',
-            'start_date': {'$lte': current_datetime},
-            'end_date': {'$gte': current_datetime}
-        })
-        
+        result = next(db.discounts.aggregate(_discount_view_pipeline(current_datetime)))
+
         discounts_list = []
-        for discount in active_discounts:
-            # Get product details for each discount using both barcode and product_barcode fields
-            product = None
-            
-            # Try to find product by product_barcode field in discount
-            if 'product_barcode' in discount:
-                product = db.products.find_one({'barcode': discount['product_barcode']})
-                if not product:
-                    # Also try matching with product_id
-                    product = db.products.find_one({'product_id': discount['product_barcode']})
-            
-            # If product_barcode doesn't exist or no product found, try using discount_id relationship
-            if not product:
-                # Find products that have this discount_id
-                product = db.products.find_one({'discount_id': discount['_id']})
-            
-            if product:
-                # Use product name from database, fallback to discount's product_name
-                product_name = product.get('name', discount.get('product_name', 'Unknown Product'))
-                product_barcode = product.get('barcode', product.get('product_id', discount.get('product_barcode', 'N/A')))
-                
-                discount_info = {
-                    'discount_id': str(discount['_id']),
-                    'name': discount['name'],
-                    'percentage': discount['percentage'],
-                    'start_date': discount['start_date'].strftime('%Y-%m-%d') if isinstance(discount['start_date'], datetime) else str(discount['start_date']),
-                    'end_date': discount['end_date'].strftime('%Y-%m-%d') if isinstance(discount['end_date'], datetime) else str(discount['end_date']),
-                    'product_name': product_name,
-                    'product_barcode': product_barcode,
-                    'original_price': product['price'],
-                    'discounted_price': round(product['price'] * (1 - discount['percentage'] / 100), 2),
-                    'savings': round(product['price'] * (discount['percentage'] / 100), 2)
-                }
-                discounts_list.append(discount_info)
-        
-        return jsonify({'discounts': discounts_list}), 200
+        # The response changes when a shown discount ends or a pending one starts
+        boundaries = [row['at'] for row in result['next_start']]
+        for discount in result['current']:
+            product = discount['product']
+            # Use product name from database, fallback to discount's product_name
+            product_name = product.get('name', discount.get('product_name', 'Unknown Product'))
+            product_barcode = product.get('barcode', product.get('product_id', discount.get('product_barcode', 'N/A')))
+
+            discount_info = {
+                'discount_id': str(discount['_id']),
+                'name': discount['name'],
+                'percentage': discount['percentage'],
+                'start_date': discount['start_date'].strftime('%Y-%m-%d') if isinstance(discount['start_date'], datetime) else str(discount['start_date']),
+                'end_date': discount['end_date'].strftime('%Y-%m-%d') if isinstance(discount['end_date'], datetime) else str(discount['end_date']),
+                'product_name': product_name,
+                'product_barcode': product_barcode,
+                'original_price': product['price'],
+                'discounted_price': round(product['price'] * (1 - discount['percentage'] / 100), 2),
+                'savings': round(product['price'] * (discount['percentage'] / 100), 2)
+            }
+            discounts_list.append(discount_info)
+            boundaries.append(discount['end_date'])
+
+        body = current_app.json.dumps({'discounts': discounts_list})
+        ttl = None
+        if boundaries:
+            ttl = max((min(boundaries) - current_datetime).total_seconds(), 0)
+        discount_view.set(body, version, ttl)
+        return current_app.response_class(body, status=200, mimetype='application/json')
     except Exception as e:
         return jsonify({'message': f'Error fetching discounts: {str(e)}'}), 500
 
@@ -384,170 +520,19 @@ def place_order():
     db = get_db()
     
     try:
-        # Get user's cart
-        cart = db.cart_items.find_one({'cart_id': data['phone_number']})
-        if not cart or not cart.get('product_id') or len(cart['product_id']) == 0:
-            return jsonify({'message': 'Cart is empty'}), 400
-        
-        # Get user details for customer name
-        user = db.users.find_one({'phone_number': data['phone_number']})
-        customer_name = user.get('name', 'Unknown Customer') if user else 'Unknown Customer'
-        
-        # Get cart products with quantities and calculate totals
-        product_ids = cart['product_id']
-        product_counts = Counter(product_ids)
-        unique_product_ids = list(product_counts.keys())
-        
-        # Fetch product details and calculate order totals
-        products = []
-        total_order_amount = 0
-        total_original_amount = 0
-        
-        product_details = db.products.find({'product_id': {'$in': unique_product_ids}})
-        for product in product_details:
-            # Check for active discounts
-            discount_price = product['price']
-            discount_percentage = 0
-            discount_name = None
-            
-            discount = None
-            
-            # First: Check if product has discount_id field
-            if 'discount_id' in product and product['discount_id']:
-                discount = db.discounts.find_one({'_id': product['discount_id']})
-            
-            # Second: If no discount found via discount_id, search by product_barcode
-            if not discount:
-                # Try to find discount by product_barcode matching product_id or barcode
-                product_barcode = product.get('barcode', product['product_id'])
-                discount = db.discounts.find_one({
-                    'product_barcode': product_barcode,
-                    'status': 'Active'
-                })
-            
-            if discount and discount['status'] == 'Active':
-                current_datetime = datetime.now()
-                
-                # Handle both datetime and date objects for comparison
-                start_date = discount['start_date']
-                end_date = discount['end_date']
-                
-                # Convert to datetime if they are date objects
-                if hasattr(start_date, 'date'):  # It's a datetime object
-                    start_datetime = start_date
-                else:  # It's a date object, convert to datetime
-                    start_datetime = datetime.combine(start_date, datetime.min.time())
-                
-                if hasattr(end_date, 'date'):  # It's a datetime object
-                    end_datetime = end_date
-                else:  # It's a date object, convert to datetime
-                    end_datetime = datetime.combine(end_date, datetime.max.time())
-                
-                if start_datetime <= current_datetime <= end_datetime:
-                    discount_percentage = discount['percentage']
-                    discount_price = product['price'] * (1 - discount_percentage / 100)
-                    discount_name = discount['name']
-            
-            quantity = product_counts[product['product_id']]
-            item_total = discount_price * quantity
-            original_total = product['price'] * quantity
-            
-            total_order_amount += item_total
-            total_original_amount += original_total
-            
-            products.append({
-                'product_id': product['product_id'],
-                'name': product['name'],
-                'price': product['price'],
-                'discount_price': round(discount_price, 2),
-                'discount_percentage': discount_percentage,
-                'discount_name': discount_name,
-                'quantity': quantity,
-                'item_total': round(item_total, 2),
-                'original_total': round(original_total, 2)
-            })
-        
-        # Create order with current date and time
-        current_datetime = datetime.now()
-        # Normalize payment method label to desired display (Card/UPI)
-        method = data['payment_method']
-        method_display = 'Card' if str(method).lower() == 'card' else ('UPI' if str(method).lower() == 'upi' else str(method))
-
-        order_data = {
-            'user_id': data['phone_number'],
-            'customer_name': customer_name,
-            'order_date': current_datetime,
-            'order_date_string': current_datetime.strftime('%Y-%m-%d %H:%M:%S'),
-            'order_timestamp': current_datetime.timestamp(),
-            'products': products,
-            'total_amount': round(total_order_amount, 2),
-            'original_total_amount': round(total_original_amount, 2),
-            'total_savings': round(total_original_amount - total_order_amount, 2),
-            'payment_method': method_display,
-            'billing_address': data.get('billing_address', ''),
-            'order_status': 'Completed',
-            'payment_status': 'Completed',
-            'delivery_status': 'Done',  # Set to "Done" as requested
-            'created_at': current_datetime,
-            'updated_at': current_datetime
-        }
-        
-        # Insert order into orders collection
-        order_result = db.orders.insert_one(order_data)
-        order_id = str(order_result.inserted_id)
-        
-        # Create order items for detailed tracking
-        order_items = []
-        for product in products:
-            order_item = {
-                'order_id': order_id,
-                'product_id': product['product_id'],
-                'product_name': product['name'],
-                'quantity': product['quantity'],
-                'unit_price': product['discount_price'],
-                'total_price': product['item_total'],
-                'original_unit_price': product['price'],
-                'original_total_price': product['original_total'],
-                'discount_percentage': product['discount_percentage'],
-                'discount_name': product['discount_name'],
-                'created_at': current_datetime
-            }
-            order_items.append(order_item)
-        
-        # Insert order items
-        if order_items:
-            db.order_items.insert_many(order_items)
-        
-        # Create payment record (store amount in paise)
-        amount_paise = int(round(total_order_amount * 100))
-        payment_data = {
-            'order_id': order_id,
-            'user_id': data['phone_number'],
-            'amount': amount_paise,
-            'payment_method': method_display,
-            'payment_status': 'Completed',
-            'transaction_id': f"TXN_{int(current_datetime.timestamp())}_{data['phone_number']}",
-            'created_at': current_datetime,
-            'updated_at': current_datetime
-        }
-
-        db.payments.insert_one(payment_data)
-        
-        # Clear the user's cart after successful order placement
-        db.cart_items.update_one(
-            {'cart_id': data['phone_number']},
-            {'$set': {'product_id': []}}
+        result, timings = checkout.place_order(
+            db,
+            data['phone_number'],
+            data['payment_method'],
+            data.get('billing_address', '')
         )
+        # Per-stage timing breakdown in debug mode
+        if current_app.debug:
+            result['timings_ms'] = timings
+        return jsonify(result), 201
         
-        return jsonify({
-            'message': 'Order placed successfully',
-            'order_id': order_id,
-            'order_date': current_datetime.strftime('%Y-%m-%d %H:%M:%S'),
-            'total_amount': total_order_amount,
-            'total_amount_paise': amount_paise,
-            'total_savings': round(total_original_amount - total_order_amount, 2)
-        }), 201
-        
+    except checkout.CheckoutError as e:
+        return jsonify({'message': e.message}), e.status_code
     except Exception as e:
         return jsonify({'message': f'Error placing order: {str(e)}'}), 500
 
@@ -567,15 +552,7 @@ def get_user_orders():
             {'_id': 0}  # Exclude MongoDB _id
         ).sort('order_date', -1))  # Sort by order date, newest first
         
-        # Format dates for frontend
-        for order in orders:
-            if 'order_date' in order and isinstance(order['order_date'], datetime):
-                order['order_date'] = order['order_date'].strftime('%Y-%m-%d %H:%M:%S')
-            if 'created_at' in order and isinstance(order['created_at'], datetime):
-                order['created_at'] = order['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            if 'updated_at' in order and isinstance(order['updated_at'], datetime):
-                order['updated_at'] = order['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
-        
+        # Dates are formatted by the app's JSON provider
         return jsonify({'orders': orders}), 200
         
     except Exception as e:
@@ -608,18 +585,7 @@ def get_order_details():
             {'_id': 0}
         ))
         
-        # Format dates
-        if 'order_date' in order and isinstance(order['order_date'], datetime):
-            order['order_date'] = order['order_date'].strftime('%Y-%m-%d %H:%M:%S')
-        if 'created_at' in order and isinstance(order['created_at'], datetime):
-            order['created_at'] = order['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-        if 'updated_at' in order and isinstance(order['updated_at'], datetime):
-            order['updated_at'] = order['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
-        
-        for item in order_items:
-            if 'created_at' in item and isinstance(item['created_at'], datetime):
-                item['created_at'] = item['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-        
+        # Dates are formatted by the app's JSON provider
         return jsonify({
             'order': order,
             'order_items': order_items
@@ -661,7 +627,7 @@ def users_signup():
     # Create an empty cart for the user
     db.cart_items.insert_one({
         'cart_id': data['phone_number'],
-        'product_id': []
+        'items': {}
     })
 
     return jsonify({'message': 'Signup successful'}), 201
@@ -841,7 +807,8 @@ def create_payment_session():
             'updated_at': current_datetime,
             'session_id': session.id,
             'currency': 'INR',
-            'stripe_session': session.id
+            'stripe_session': session.id,
+            'stripe_metadata': session_metadata
         }
         
         # Add billing information if provided
@@ -853,6 +820,7 @@ def create_payment_session():
         # Insert payment record
         payment_result = db.payments.insert_one(payment_record)
         payment_record_id = str(payment_result.inserted_id)
+        record_payment(db, payment_record)
         
         # Create transaction record in transactions collection
         transaction_record = {
@@ -916,80 +884,53 @@ def get_payment_status(session_id):
     Check the status of a payment session
     """
     try:
-        # Retrieve the session from Stripe
-        session = stripe.checkout.Session.retrieve(session_id)
-
-        # Update local database record
         db = get_db()
-        current_datetime = datetime.now()
 
         # Find payment record by session_id
         payment_record = db.payments.find_one({'session_id': session_id})
 
+        # With webhooks configured the local record is kept current by Stripe's
+        # events, so polls are answered without calling Stripe
+        if STRIPE_WEBHOOK_SECRET and payment_record:
+            return jsonify(payments.local_status_response(payment_record)), 200
+
+        # Completed and failed payments cannot change any more
+        if payment_record and payment_record.get('payment_status') in payments.TERMINAL_STATUSES:
+            return jsonify(payments.local_status_response(payment_record)), 200
+
+        # Pending sessions reach Stripe at most once per STRIPE_POLL_MIN_INTERVAL
+        found, cached_response = payment_status_cache.lookup(session_id)
+        if found:
+            return jsonify(cached_response), 200
+
+        # Retrieve the session from Stripe
+        session = stripe.checkout.Session.retrieve(session_id)
+
         # Determine payment completion state. For UPI (async), the Checkout Session
         # may not have immediate 'paid' state; check associated PaymentIntent when present.
-        stripe_payment_status = getattr(session, 'payment_status', None)
-        payment_completed = False
         pi_status = None
-
-        # If Checkout session reports payment_status == 'paid', consider completed
-        if stripe_payment_status == 'paid':
-            payment_completed = True
-        else:
+        if getattr(session, 'payment_status', None) != 'paid':
             # If there's a payment_intent attached, fetch it and inspect the status
             payment_intent_id = getattr(session, 'payment_intent', None)
             if payment_intent_id:
                 try:
                     pi = stripe.PaymentIntent.retrieve(payment_intent_id)
                     pi_status = getattr(pi, 'status', None)
-                    if pi_status in ('succeeded', 'requires_capture'):
-                        payment_completed = True
                 except Exception:
                     # ignore intent retrieval errors here; leave as pending
                     pi_status = None
 
+        state = payments.session_state(session, pi_status)
+
+        # Update payment and transaction records
         if payment_record:
-            new_status = 'Completed' if payment_completed else 'Pending'
-
-            # Update payment status in payments collection
-            db.payments.update_one(
-                {'session_id': session_id},
-                {'$set': {
-                    'payment_status': new_status,
-                    'updated_at': current_datetime,
-                    'stripe_payment_status': stripe_payment_status,
-                    'stripe_payment_intent_status': pi_status
-                }}
-            )
-
-            # Update transaction status in transactions collection
-            payment_id = str(payment_record['_id'])
-            db.transactions.update_one(
-                {'$or': [
-                    {'transaction_id': payment_id},
-                    {'order_id': payment_id}
-                ]},
-                {'$set': {
-                    'payment_status': new_status,
-                    'updated_at': current_datetime,
-                    'transaction_date': current_datetime if new_status == 'Completed' else payment_record.get('created_at', current_datetime),
-                    'gateway_response.response_code': '200' if payment_completed else '102',
-                    'gateway_response.response_message': 'Payment successful' if payment_completed else 'Payment pending',
-                    'gateway_response.gateway_transaction_id': session.id
-                }}
-            )
+            payments.apply_payment_state(db, payment_record, state)
 
         # Return enriched info so frontend can debug async payments (UPI)
-        return jsonify({
-            'session_id': session_id,
-            'checkout_payment_status': stripe_payment_status,
-            'payment_intent_status': pi_status,
-            'payment_completed': payment_completed,
-            'amount_total': getattr(session, 'amount_total', None),
-            'currency': getattr(session, 'currency', None),
-            'customer_email': session.customer_details.email if session.customer_details else None,
-            'metadata': session.metadata
-        }), 200
+        response = payments.session_status_response(session_id, state)
+        if state['payment_status'] not in payments.TERMINAL_STATUSES:
+            payment_status_cache.set(session_id, response)
+        return jsonify(response), 200
         
     except Exception as e:
         # Check if it's a Stripe-related error
@@ -1005,9 +946,34 @@ def get_payment_status(session_id):
             }), 500
 
 
+@users_bp.route('/users/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    """
+    Receive signed Stripe events and apply Checkout Session outcomes to the
+    payments and transactions collections
+    """
+    if not STRIPE_WEBHOOK_SECRET:
+        return jsonify({'error': 'Webhook secret not configured'}), 503
 
+    payload = request.get_data()
+    signature = request.headers.get('Stripe-Signature', '')
+    try:
+        event = stripe.Webhook.construct_event(payload, signature, STRIPE_WEBHOOK_SECRET)
+    except ValueError:
+        return jsonify({'error': 'Invalid payload'}), 400
+    except stripe.error.SignatureVerificationError:
+        return jsonify({'error': 'Invalid signature'}), 400
 
+    if event['type'] not in payments.SESSION_EVENTS:
+        # Acknowledge events we do not track so Stripe stops retrying them
+        return jsonify({'received': True}), 200
 
+    session = event['data']['object']
+    db = get_db()
+    payment_record = db.payments.find_one({'session_id': session['id']})
+    if not payment_record:
+        return jsonify({'received': True, 'message': 'Unknown session'}), 200
 
-
-
+    state = payments.session_state(session, event_type=event['type'])
+    new_status = payments.apply_payment_state(db, payment_record, state)
+    return jsonify({'received': True, 'payment_status': new_status}), 200
@@ -0,0 +1,29 @@
+"""Collection version counters used as HTTP cache validators.
+
+Writes that change what a listing shows call bump_version(); readers build
+their ETag from get_version(), which is a single _id lookup, so an unchanged
+listing can be answered with 304 without running its query. The counters
+live in Mongo so every worker process sees the same value.
+"""
+
+from datetime import datetime
+
+VERSIONS_COLLECTION = 'versions'
+
+# Product catalog as shown in the admin (admin product writes)
+CATALOG = 'catalog'
+# Discounts collection (admin discount writes)
+DISCOUNTS = 'discounts'
+
+
+def bump_version(db, name):
+    db[VERSIONS_COLLECTION].update_one(
+        {'_id': name},
+        {'$inc': {'version': 1}, '$set': {'updated_at': datetime.now()}},
+        upsert=True
+    )
+
+
+def get_version(db, name):
+    doc = db[VERSIONS_COLLECTION].find_one({'_id': name}, {'version': 1})
+    return doc['version'] if doc else 0
@@ -0,0 +1,17 @@
+"""Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is built once here (in the gunicorn master when preload_app is on)
+and forked into the workers. Background threads are not started in this
+process; gunicorn.conf.py starts them in each worker after the fork.
+"""
+
+from app import create_app
+from db import close_client
+
+app = create_app({'START_BACKGROUND': False})
+
+# Migrations may have opened the pool here. Close it so no sockets or monitor
+# threads are inherited by forked workers; each opens its own on first use.
+close_client()